@@ -0,0 +1,7 @@
+"""
+Offline load-test harness for Inawo.
+
+Spins up local stand-ins for Groq, the Meta Graph API and the Telegram Bot API,
+points the real `main.app` at them and replays realistic webhook traffic.
+Run with `python -m benchmarks.run --help`.
+"""
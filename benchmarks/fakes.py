@@ -0,0 +1,283 @@
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+# 1x1 transparent PNG: small enough to keep memory numbers about the app, not the payload
+FAKE_IMAGE_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c489"
+    "0000000d49444154789c63000100000500010d0a2db40000000049454e44ae426082"
+)
+
+
+class FakeService:
+    """
+    Base class for a local HTTP stand-in with latency and error injection.
+    Subclasses implement `handle()` and return (status, content_type, body).
+    """
+    name = "fake"
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self.calls = Counter()
+        self.errors = 0
+
+    # --- LIFECYCLE ---
+
+    def start(self) -> str:
+        """Binds to a free localhost port and returns the base URL."""
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _dispatch(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                status, content_type, payload = service._respond(
+                    method, self.path, self.headers.get("Content-Type", ""), body
+                )
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def log_message(self, *args):
+                pass  # Keep benchmark output readable
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset(self):
+        """Clears call counters between scenarios."""
+        with self._lock:
+            self.calls.clear()
+            self.errors = 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"calls": sum(self.calls.values()), "errors": self.errors, "by_route": dict(self.calls)}
+
+    # --- REQUEST PIPELINE ---
+
+    def _respond(self, method, path, content_type, body):
+        with self._lock:
+            delay = self.latency_ms + self._rng.uniform(0, self.jitter_ms)
+            fail = self._rng.random() < self.error_rate
+
+        if delay:
+            time.sleep(delay / 1000)
+
+        status, resp_type, payload, route = self.handle(method, path, content_type, body)
+
+        with self._lock:
+            self.calls[route] += 1
+            if fail:
+                self.errors += 1
+
+        if fail:
+            return 500, "application/json", json.dumps({"error": {"message": f"Injected {self.name} failure"}}).encode()
+        return status, resp_type, payload
+
+    def handle(self, method, path, content_type, body):
+        raise NotImplementedError
+
+    @staticmethod
+    def _json(data, status: int = 200, route: str = "other"):
+        return status, "application/json", json.dumps(data).encode(), route
+
+
+class FakeGroq(FakeService):
+    """
+    OpenAI-compatible chat completions endpoint as served by Groq.
+    Simulates provider prefix caching: a system prompt already seen for a
+    model is reported back as cached prompt tokens.
+    """
+    name = "groq"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._seen_prefixes = set()
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def reset(self):
+        super().reset()
+        with self._lock:
+            self.prompt_tokens = 0
+            self.cached_tokens = 0
+
+    def snapshot(self) -> dict:
+        snap = super().snapshot()
+        with self._lock:
+            snap.update(prompt_tokens=self.prompt_tokens, cached_prompt_tokens=self.cached_tokens)
+        return snap
+
+    def handle(self, method, path, content_type, body):
+        if method != "POST" or not path.endswith("/chat/completions"):
+            return self._json({"error": {"message": "Not found"}}, 404)
+
+        req = json.loads(body or b"{}")
+        model = req.get("model", "unknown")
+        messages = req.get("messages", [])
+        is_vision = any(isinstance(m.get("content"), list) for m in messages)
+        prompt_text = " ".join(m["content"] for m in messages if isinstance(m.get("content"), str))
+
+        if is_vision:
+            content = json.dumps({
+                "sender_name": "ADAEZE OKAFOR",
+                "amount": 20000,
+                "bank": "GTBank",
+                "ref": "000013240521120000001",
+                "status": "Success",
+            })
+        elif "You route customer messages" in prompt_text:
+            content = "COMPLEX" if "?" in prompt_text.split("Message:")[-1] else "SIMPLE"
+        elif "Extract from:" in prompt_text:
+            content = json.dumps({"item": "Lace 6 yard", "total": 20000.0}) if "want" in prompt_text.lower() else "null"
+        else:
+            content = "Welcome! Lace 6 yard is ₦20,000. Bless you!"
+
+        # Rough token counts so billing-sensitive changes are visible too
+        prompt_tokens = max(1, len(prompt_text) // 4)
+        completion_tokens = max(1, len(content) // 4)
+        cached_tokens = 0
+        system = next((m["content"] for m in messages if m.get("role") == "system" and isinstance(m.get("content"), str)), None)
+        if system:
+            key = (model, system)
+            with self._lock:
+                if key in self._seen_prefixes:
+                    cached_tokens = len(system) // 4
+                else:
+                    self._seen_prefixes.add(key)
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+            # Spread of first-token certainty, so some classifier verdicts fall under the router's threshold
+            first_token_p = self._rng.uniform(0.55, 0.99)
+
+        choice = {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+        if req.get("logprobs"):
+            choice["logprobs"] = {"content": [
+                {"token": content[:4], "logprob": math.log(first_token_p), "bytes": None, "top_logprobs": []},
+            ]}
+        return self._json({
+            "id": f"chatcmpl-{self._rng.getrandbits(32):08x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [choice],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        }, route=f"{'vision' if is_vision else 'chat'}:{model}")
+
+
+class FakeGraph(FakeService):
+    """Meta Graph API: media lookup, media download and message sends."""
+    name = "graph"
+
+    def handle(self, method, path, content_type, body):
+        parts = path.split("?", 1)[0].strip("/").split("/")
+
+        if method == "GET" and parts[0] == "media":
+            return 200, "image/png", FAKE_IMAGE_BYTES, "media_download"
+
+        if method == "GET" and len(parts) == 2:
+            return self._json({
+                "id": parts[1],
+                "url": f"{self.base_url}/media/{parts[1]}",
+                "mime_type": "image/png",
+            }, route="media_lookup")
+
+        if method == "POST" and len(parts) == 3 and parts[2] == "messages":
+            to = json.loads(body or b"{}").get("to", "")
+            return self._json({
+                "messaging_product": "whatsapp",
+                "contacts": [{"input": to, "wa_id": to}],
+                "messages": [{"id": f"wamid.{self._rng.getrandbits(48):012x}"}],
+            }, route="messages")
+
+        return self._json({"error": {"message": "Not found"}}, 404)
+
+
+class FakeTelegram(FakeService):
+    """Telegram Bot API: getMe, sendMessage, getFile and file downloads."""
+    name = "telegram"
+
+    def handle(self, method, path, content_type, body):
+        parts = path.strip("/").split("/")
+
+        if parts[0] == "file":
+            return 200, "image/png", FAKE_IMAGE_BYTES, "file_download"
+
+        api_method = parts[-1]
+        params = self._parse_params(content_type, body)
+
+        if api_method == "getMe":
+            return self._json({"ok": True, "result": {
+                "id": 1000001, "is_bot": True, "first_name": "Inawo", "username": "Inawo_Bot",
+            }}, route=api_method)
+
+        if api_method == "sendMessage":
+            return self._json({"ok": True, "result": {
+                "message_id": self._rng.randint(1, 10**9),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "text": params.get("text", ""),
+            }}, route=api_method)
+
+        if api_method == "getFile":
+            file_id = params.get("file_id", "file")
+            return self._json({"ok": True, "result": {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_size": len(FAKE_IMAGE_BYTES),
+                "file_path": f"photos/{file_id}.png",
+            }}, route=api_method)
+
+        return self._json({"ok": True, "result": True}, route=api_method)
+
+    @staticmethod
+    def _parse_params(content_type, body):
+        if not body:
+            return {}
+        if "json" in content_type:
+            return json.loads(body)
+        if "x-www-form-urlencoded" in content_type:
+            return {k: v[0] for k, v in parse_qs(body.decode()).items()}
+        return {}
@@ -0,0 +1,135 @@
+import random
+import time
+
+# Realistic mix of customer turns: greetings, price questions, orders and thanks
+SAMPLE_TEXTS = [
+    "Hi",
+    "Good morning, how far?",
+    "How much is Lace 6 yard?",
+    "Do you have Aso oke in stock?",
+    "I want 2 Ankara 6 yard, deliver to Lekki",
+    "I want Lace 6 yard for my sister's wedding",
+    "Abeg what colours of Guinea do you have?",
+    "Thanks, I'll send the money now",
+    "Ok",
+    "Please can you reduce the price small?",
+]
+
+DEFAULT_PHONE_NUMBER_ID = "100000000000001"
+
+
+def customer_number(index: int) -> str:
+    return f"2348{index:09d}"
+
+
+def _wamid(rng: random.Random) -> str:
+    return f"wamid.HBgN{rng.getrandbits(64):016X}"
+
+
+def _text_message(rng, sender, text):
+    return {
+        "from": sender,
+        "id": _wamid(rng),
+        "timestamp": str(int(time.time())),
+        "type": "text",
+        "text": {"body": text},
+    }
+
+
+def _image_message(rng, sender):
+    return {
+        "from": sender,
+        "id": _wamid(rng),
+        "timestamp": str(int(time.time())),
+        "type": "image",
+        "image": {
+            "id": str(rng.randint(10**14, 10**15 - 1)),
+            "mime_type": "image/jpeg",
+            "sha256": f"{rng.getrandbits(128):032x}",
+        },
+    }
+
+
+def _change(sender, messages, phone_number_id):
+    return {
+        "field": "messages",
+        "value": {
+            "messaging_product": "whatsapp",
+            "metadata": {"display_phone_number": "2348000000000", "phone_number_id": phone_number_id},
+            "contacts": [{"profile": {"name": "Benchmark Customer"}, "wa_id": sender}],
+            "messages": messages,
+        },
+    }
+
+
+def _envelope(changes):
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{"id": "WHATSAPP_BUSINESS_ACCOUNT_ID", "changes": changes}],
+    }
+
+
+def whatsapp_text(rng, sender, phone_number_id=DEFAULT_PHONE_NUMBER_ID):
+    """A single inbound text message exactly as Meta delivers it."""
+    return _envelope([_change(sender, [_text_message(rng, sender, rng.choice(SAMPLE_TEXTS))], phone_number_id)])
+
+
+def whatsapp_image(rng, sender, phone_number_id=DEFAULT_PHONE_NUMBER_ID):
+    """A single inbound receipt photo."""
+    return _envelope([_change(sender, [_image_message(rng, sender)], phone_number_id)])
+
+
+def whatsapp_batch(rng, senders, per_sender=3, phone_number_id=DEFAULT_PHONE_NUMBER_ID):
+    """
+    One delivery carrying several messages, the way Meta batches during bursts:
+    one change per customer with `per_sender` text messages each.
+    """
+    changes = [
+        _change(s, [_text_message(rng, s, rng.choice(SAMPLE_TEXTS)) for _ in range(per_sender)], phone_number_id)
+        for s in senders
+    ]
+    return _envelope(changes)
+
+
+def count_handled_messages(payload) -> int:
+    """
+    Messages the webhook actually turns into a reply: it handles only
+    `messages[0]` of each change, so extra messages in a change don't count.
+    """
+    return sum(
+        1
+        for entry in payload.get("entry", [])
+        for change in entry.get("changes", [])
+        if change.get("value", {}).get("messages")
+    )
+
+
+def telegram_text(rng, update_id, chat_id):
+    """A Telegram `Update` dict for a private text message."""
+    user = {"id": chat_id, "is_bot": False, "first_name": "Benchmark", "last_name": "Customer"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "first_name": "Benchmark"},
+            "from": user,
+            "text": rng.choice(SAMPLE_TEXTS),
+        },
+    }
+
+
+def telegram_photo(rng, update_id, chat_id):
+    """A Telegram `Update` dict for a receipt photo."""
+    user = {"id": chat_id, "is_bot": False, "first_name": "Benchmark", "last_name": "Customer"}
+    file_id = f"AgAC{rng.getrandbits(64):016x}"
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "first_name": "Benchmark"},
+            "from": user,
+            "photo": [{"file_id": file_id, "file_unique_id": file_id, "width": 1080, "height": 1920}],
+        },
+    }
@@ -0,0 +1,391 @@
+"""
+Replays WhatsApp and Telegram traffic against the real `main.app` with every
+external dependency replaced by a local fake.
+
+    python -m benchmarks.run --messages 200 --concurrency 20 --output bench.json
+    python -m benchmarks.run --groq-latency-ms 300 --compare bench.json
+
+Results are written as JSON so two runs (e.g. before/after a change) can be diffed.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import payloads
+from benchmarks.fakes import FakeGraph, FakeGroq, FakeTelegram
+
+SCENARIOS = ("text", "image", "batch", "telegram")
+TELEGRAM_CHAT_BASE = 700000000
+
+# Metrics shown by --compare; lower is better for all but throughput
+COMPARE_METRICS = (
+    "p50_ms", "p95_ms", "p99_ms", "throughput_msg_s", "llm_calls_per_message", "rss_growth_mb", "app_errors",
+)
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Offline Inawo load test")
+    p.add_argument("--messages", type=int, default=100, help="Requests per scenario")
+    p.add_argument("--concurrency", type=int, default=10)
+    p.add_argument("--customers", type=int, default=25, help="Distinct customer numbers to rotate through")
+    p.add_argument("--vendors", type=int, default=1, help="Vendors with their own WhatsApp number; customer i talks to vendor i %% vendors")
+    p.add_argument("--batch-size", type=int, default=3, help="Customers per batched webhook delivery")
+    p.add_argument("--warmup", type=int, default=5)
+    p.add_argument("--scenarios", default=",".join(SCENARIOS))
+    p.add_argument("--seed", type=int, default=1234)
+    for svc in ("groq", "graph", "telegram"):
+        p.add_argument(f"--{svc}-latency-ms", type=float, default=0.0)
+        p.add_argument(f"--{svc}-error-rate", type=float, default=0.0)
+    p.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform jitter added to every fake call")
+    p.add_argument("--output", help="Write results JSON here")
+    p.add_argument("--compare", help="Baseline results JSON to diff against")
+    return p.parse_args(argv)
+
+
+# --- ENVIRONMENT ---
+
+def configure_environment(fakes, db_path):
+    """Must run before `main` is imported: every client reads its config at import time."""
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "GROQ_API_KEY": "bench-groq-key",
+        "GROQ_API_BASE": fakes["groq"].base_url,
+        "WHATSAPP_TOKEN": "bench-whatsapp-token",
+        "PHONE_NUMBER_ID": payloads.DEFAULT_PHONE_NUMBER_ID,
+        "GRAPH_API_BASE": fakes["graph"].base_url,
+        "TELEGRAM_TOKEN": "123456:BENCH",
+        "TELEGRAM_API_BASE": fakes["telegram"].base_url,
+    })
+
+
+def vendor_phone_number_id(customer_index, vendors):
+    """Business number of the vendor a benchmark customer talks to."""
+    return str(int(payloads.DEFAULT_PHONE_NUMBER_ID) + customer_index % vendors)
+
+
+def seed_database(args):
+    import models
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        vendors = [
+            models.Vendor(
+                business_name="Ziggiphase fabrics" if k == 0 else f"Bench Vendor {k}",
+                email=f"bench{k}@inawo.test",
+                password_hash="not-a-real-hash",
+                category="fashion",
+                knowledge_base_text="Lace 6 yard - 20000\nAnkara 6 yard - 12000\nAso oke 6 yard - 10000\nGuniea 6 yard - 23000",
+                out_of_stock_items="Aso oke",
+                whatsapp_phone_number_id=vendor_phone_number_id(k, args.vendors),
+                whatsapp_token=f"bench-token-{k}",
+            )
+            for k in range(args.vendors)
+        ]
+        db.add_all(vendors)
+        db.commit()
+        vendor_ids = [v.id for v in vendors]
+
+        for i in range(args.customers):
+            db.add(models.ChatSession(customer_number=payloads.customer_number(i), vendor_id=vendor_ids[i % args.vendors]))
+            db.add(models.ChatSession(customer_number=str(TELEGRAM_CHAT_BASE + i), vendor_id=vendor_ids[0]))
+        db.commit()
+        return vendor_ids
+    finally:
+        db.close()
+
+
+def seed_pending_orders(vendor_ids, count, customers):
+    """Gives the receipt path something to match so it runs end to end."""
+    import models
+    from database import SessionLocal
+    from reconciliation import reconciler
+
+    db = SessionLocal()
+    try:
+        db.add_all([
+            models.Order(
+                vendor_id=vendor_ids[(i % customers) % len(vendor_ids)],
+                customer_number=payloads.customer_number(i % customers),
+                items="Lace 6 yard",
+                amount=20000.0,
+            )
+            for i in range(count)
+        ])
+        db.commit()
+        # Written behind the reconciler's back, so force a reload of its index
+        for vendor_id in vendor_ids:
+            reconciler.index.invalidate(vendor_id)
+    finally:
+        db.close()
+
+
+# --- MEASUREMENT ---
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile; stable for the small sample sizes used here."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def peak_rss_mb():
+    """Lifetime peak of the whole process, fakes included: only meaningful for the run as a whole."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def current_rss_mb():
+    """Resident memory right now (after a GC pass), so scenarios can report what they left behind."""
+    gc.collect()
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except (OSError, ValueError, IndexError):
+        # No procfs (macOS): the peak is the closest thing available
+        return peak_rss_mb()
+
+
+def summarize(latencies, wall_s, message_count, app_errors, fakes, rss_growth_mb):
+    from model_router import routing_stats
+    from vendor_context import context_stats
+
+    latencies = sorted(latencies)
+    groq = fakes["groq"].snapshot()
+    return {
+        "requests": len(latencies),
+        "messages": message_count,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        "throughput_msg_s": round(message_count / wall_s, 2) if wall_s else 0.0,
+        "llm_calls": groq["calls"],
+        "llm_calls_per_message": round(groq["calls"] / message_count, 3) if message_count else 0.0,
+        "llm_calls_by_route": groq["by_route"],
+        "llm_routing": routing_stats.snapshot(),
+        "llm_prompt_tokens": groq["prompt_tokens"],
+        "llm_cached_prompt_tokens": groq["cached_prompt_tokens"],
+        "prompt_context": context_stats.snapshot(),
+        "graph_calls": fakes["graph"].snapshot()["calls"],
+        "telegram_calls": fakes["telegram"].snapshot()["calls"],
+        "injected_errors": sum(f.snapshot()["errors"] for f in fakes.values()),
+        "app_errors": app_errors,
+        "rss_growth_mb": rss_growth_mb,
+    }
+
+
+async def _drive(jobs, concurrency):
+    """Runs (message_count, coroutine_factory) jobs with bounded concurrency."""
+    sem = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(factory):
+        nonlocal errors
+        async with sem:
+            start = time.perf_counter()
+            ok = await factory()
+            latencies.append((time.perf_counter() - start) * 1000)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(factory) for _, factory in jobs))
+    return latencies, time.perf_counter() - start, errors
+
+
+def _webhook_job(client, payload):
+    async def post():
+        resp = await client.post("/webhook", json=payload)
+        return resp.status_code == 200 and resp.json().get("status") in ("success", None)
+    return payloads.count_handled_messages(payload), post
+
+
+def _telegram_job(bot_application, data):
+    from telegram import Update
+
+    async def process():
+        try:
+            await bot_application.process_update(Update.de_json(data, bot_application.bot))
+            return True
+        except Exception as e:
+            print(f"⚠️ Telegram replay error: {e}")
+            return False
+    return 1, process
+
+
+def build_jobs(name, args, rng, client, bot_application):
+    n, customers, vendors = args.messages, args.customers, args.vendors
+
+    def whatsapp(build, i):
+        c = i % customers
+        return _webhook_job(client, build(rng, payloads.customer_number(c), vendor_phone_number_id(c, vendors)))
+
+    if name == "text":
+        return [whatsapp(payloads.whatsapp_text, i) for i in range(n)]
+    if name == "image":
+        return [whatsapp(payloads.whatsapp_image, i) for i in range(n)]
+    if name == "batch":
+        jobs = []
+        for i in range(n):
+            # One delivery per business number: every sender belongs to the same vendor
+            first = (i * args.batch_size) % customers
+            senders = [(first + j * vendors) % customers for j in range(args.batch_size)]
+            jobs.append(_webhook_job(client, payloads.whatsapp_batch(
+                rng, [payloads.customer_number(c) for c in senders], phone_number_id=vendor_phone_number_id(first, vendors)
+            )))
+        return jobs
+    if name == "telegram":
+        jobs = []
+        for i in range(n):
+            build = payloads.telegram_photo if i % 5 == 4 else payloads.telegram_text
+            jobs.append(_telegram_job(bot_application, build(rng, i + 1, TELEGRAM_CHAT_BASE + i % customers)))
+        return jobs
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+# --- REPORTING ---
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def print_report(results, baseline=None):
+    print(f"\n📊 Inawo benchmark @ {results['revision'] or 'unknown'} (process peak RSS {results['peak_rss_mb']} MB, fakes included)")
+    header = f"{'scenario':<10}{'msgs':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'msg/s':>9}{'llm/msg':>9}{'+rss MB':>9}{'errors':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results["scenarios"].items():
+        print(
+            f"{name:<10}{r['messages']:>6}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}"
+            f"{r['throughput_msg_s']:>9.1f}{r['llm_calls_per_message']:>9.2f}{r['rss_growth_mb']:>9.1f}{r['app_errors']:>8}"
+        )
+
+    if not baseline:
+        return
+    if baseline.get("config") != results["config"]:
+        print("\n⚠️ Baseline was recorded with a different config; deltas may not be comparable.")
+    print(f"\nΔ vs baseline @ {baseline.get('revision') or 'unknown'}")
+    for name, r in results["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        deltas = []
+        for metric in COMPARE_METRICS:
+            before, after = old.get(metric, 0), r.get(metric, 0)
+            pct = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+            deltas.append(f"{metric}={after} ({pct})")
+        print(f"  {name}: " + ", ".join(deltas))
+
+
+# --- ENTRY POINT ---
+
+async def run(args):
+    fakes = {
+        "groq": FakeGroq(args.groq_latency_ms, args.jitter_ms, args.groq_error_rate, args.seed),
+        "graph": FakeGraph(args.graph_latency_ms, args.jitter_ms, args.graph_error_rate, args.seed + 1),
+        "telegram": FakeTelegram(args.telegram_latency_ms, args.jitter_ms, args.telegram_error_rate, args.seed + 2),
+    }
+    for fake in fakes.values():
+        fake.start()
+    workdir = tempfile.mkdtemp(prefix="inawo-bench-")
+    try:
+        return await _run_scenarios(args, fakes, os.path.join(workdir, "bench.db"))
+    finally:
+        for fake in fakes.values():
+            fake.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+async def _run_scenarios(args, fakes, db_path):
+    configure_environment(fakes, db_path)
+
+    # Imported late so the app binds to the fakes configured above
+    import httpx
+    import main
+    from inawo_bot import bot_application
+    from model_router import routing_stats
+    from transcript_buffer import transcript_buffer
+    from vendor_context import context_stats
+
+    vendor_ids = seed_database(args)
+    await bot_application.initialize()
+    # ASGITransport skips startup/shutdown events, so mirror them here
+    transcript_buffer.start()
+
+    rng = random.Random(args.seed)
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    results = {
+        "revision": git_revision(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "scenarios": {},
+    }
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        if args.warmup:
+            warm = [
+                _webhook_job(client, payloads.whatsapp_text(
+                    rng, payloads.customer_number(i), vendor_phone_number_id(i, args.vendors)
+                ))
+                for i in range(args.warmup)
+            ]
+            await _drive(warm, args.concurrency)
+
+        for name in scenarios:
+            if name == "image":
+                seed_pending_orders(vendor_ids, args.messages, args.customers)
+            jobs = build_jobs(name, args, rng, client, bot_application)
+            for fake in fakes.values():
+                fake.reset()
+            routing_stats.reset()
+            context_stats.reset()
+            rss_before = current_rss_mb()
+            latencies, wall_s, app_errors = await _drive(jobs, args.concurrency)
+            results["scenarios"][name] = summarize(
+                latencies, wall_s, sum(count for count, _ in jobs), app_errors, fakes,
+                rss_growth_mb=round(current_rss_mb() - rss_before, 1)
+            )
+
+    await transcript_buffer.stop()
+    await bot_application.shutdown()
+    main.engine.dispose()
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,9 +12,12 @@ if DATABASE_URL.startswith("postgres://"):
 
 # 3. Create the Engine
 # pool_pre_ping=True checks the connection before using it (fixes "idling" errors)
+# SQLite connections are shared between FastAPI's threadpool and the event loop
+connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
 engine = create_engine(
     DATABASE_URL, 
-    pool_pre_ping=True
+    pool_pre_ping=True,
+    connect_args=connect_args
 )
 
 # 4. Create the Session Factory
@@ -1,4 +1,7 @@
-from fastapi import Depends, HTTPException, status
+import hmac
+import os
+from typing import Optional
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from database import get_db
@@ -42,3 +45,14 @@ async def get_current_vendor(token: str = Depends(oauth2_scheme), db: Session =
         raise credentials_exception
         
     return vendor
+
+# Shared secret for the /ops/* endpoints; when unset they are disabled entirely
+OPS_TOKEN = os.getenv("OPS_TOKEN")
+
+async def require_ops_token(x_ops_token: Optional[str] = Header(None)):
+    """
+    Guards internal metrics (breaker state, cache and token counts) behind the
+    `X-Ops-Token` header.
+    """
+    if not OPS_TOKEN or not x_ops_token or not hmac.compare_digest(x_ops_token, OPS_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Ops token required")
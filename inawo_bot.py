@@ -1,11 +1,17 @@
 import os
 import json
+import time
+from datetime import datetime, timezone
 from telegram import Update
 from telegram.ext import ApplicationBuilder, MessageHandler, filters, ContextTypes, CommandHandler
 from inawo_logic import inawo_app 
 from vision_service import extract_receipt_details 
 from database import SessionLocal
 from models import Sale, ChatSession, Vendor
+from transcript_buffer import transcript_buffer
+from reconciliation import reconciler
+from resilience import admission, ACCEPT, SHED
+from vendor_context import chat_config
 
 # --- 1. START COMMAND (Unified Vendor & Customer Entry) ---
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -33,13 +39,23 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 vendor_id = int(args[0])
                 vendor = db.query(Vendor).get(vendor_id)
                 if vendor:
-                    session = db.query(ChatSession).filter(ChatSession.customer_number == chat_id).first()
+                    session = db.query(ChatSession).filter(
+                        ChatSession.customer_number == chat_id, ChatSession.vendor_id == vendor_id
+                    ).first()
                     if not session:
                         session = ChatSession(customer_number=chat_id, vendor_id=vendor_id)
                         db.add(session)
                     else:
-                        session.vendor_id = vendor_id
+                        # The most recently opened vendor link is the one this chat talks to
+                        session.last_opened_at = datetime.now(timezone.utc)
+                    # Matched against receipt senders and statement narrations
+                    full_name = update.effective_user.full_name
+                    renamed = bool(full_name) and session.customer_name != full_name
+                    if renamed:
+                        session.customer_name = full_name
                     db.commit()
+                    if renamed:
+                        reconciler.index.invalidate(vendor_id)
 
                     await update.message.reply_text(
                         f"Welcome to {vendor.business_name}! 🛍️\n"
@@ -57,86 +73,139 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     finally:
         db.close()
 
+def _active_session(db, chat_id: str):
+    """One bot serves every vendor: the chat belongs to whichever vendor link it opened last."""
+    return db.query(ChatSession).filter(ChatSession.customer_number == chat_id).order_by(
+        ChatSession.last_opened_at.desc().nullslast(), ChatSession.id.desc()
+    ).first()
+
 # --- 2. TEXT MESSAGE HANDLER ---
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_text = update.message.text
     chat_id = str(update.message.chat_id)
     db = SessionLocal()
+    # Telegram updates can't be redelivered, so overload degrades instead of shedding
+    mode = admission.enter()
+    start = time.perf_counter()
     
     try:
-        session = db.query(ChatSession).filter(ChatSession.customer_number == chat_id).first()
+        session = _active_session(db, chat_id)
         
         # If no session, we don't know which business to represent
         if not session:
             return
 
-        # Check if Human Take-Over is active
-        if session.is_ai_paused:
-            return 
-
         vendor = db.query(Vendor).get(session.vendor_id)
         if not vendor:
             return
 
+        full_name = update.effective_user.full_name
+        if full_name and session.customer_name != full_name:
+            session.customer_name = full_name
+            db.commit()
+            reconciler.index.invalidate(vendor.id)
+
+        # Logged even during Human Take-Over so the vendor sees the full thread
+        transcript_buffer.add(vendor.id, chat_id, "user", user_text)
+
+        # Check if Human Take-Over is active
+        if session.is_ai_paused:
+            return 
+
         # Prepare context for the LangGraph Brain
-        config = {
-            "configurable": {
-                "thread_id": chat_id,
-                "business_data": vendor.business_name,
-                "knowledge": vendor.knowledge_base_text,
-                "out_of_stock": vendor.out_of_stock_items or "None"
-            }
-        }
+        # Memory is per (vendor, customer), same as WhatsApp, so a second vendor's chat starts fresh
+        config = chat_config(vendor, f"{vendor.id}:{chat_id}", degraded=mode != ACCEPT)
 
         inputs = {"messages": [("user", user_text)]}
         result = await inawo_app.ainvoke(inputs, config)
         
         # Reply with the AI's response
-        await update.message.reply_text(result["messages"][-1].content)
+        reply = result["messages"][-1].content
+        await update.message.reply_text(reply)
+        transcript_buffer.add(vendor.id, chat_id, "assistant", reply)
         
     except Exception as e:
         print(f"⚠️ Bot Message Error: {e}")
     finally:
+        if mode != SHED:
+            admission.exit((time.perf_counter() - start) * 1000)
         db.close()
 
 # --- 3. PHOTO HANDLER (Payment Receipts) ---
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = str(update.message.chat_id)
-    photo_file = await update.message.photo[-1].get_file()
-    image_bytes = await photo_file.download_as_bytearray()
-    
-    await update.message.reply_text("I see a receipt! Checking that for you... 🧐")
-    
-    # Process with Groq Vision
-    receipt_data = await extract_receipt_details(bytes(image_bytes))
-    
-    if "error" in receipt_data:
-        await update.message.reply_text("I couldn't quite read that. Could you send a clearer photo?")
-        return
-
     db = SessionLocal()
+    # Same admission as text: under overload the receipt is stored for the vendor instead of read
+    mode = admission.enter()
+    start = time.perf_counter()
+
     try:
-        session = db.query(ChatSession).filter(ChatSession.customer_number == chat_id).first()
-        if session:
-            new_sale = Sale(
-                amount=float(receipt_data.get('amount', 0)),
-                customer_name=update.message.from_user.full_name or "Telegram User",
+        session = _active_session(db, chat_id)
+        if not session:
+            return
+
+        photo = update.message.photo[-1]
+        customer_name = update.message.from_user.full_name or "Telegram User"
+        await update.message.reply_text("I see a receipt! Checking that for you... 🧐")
+
+        # Process with Groq Vision
+        if mode == ACCEPT:
+            photo_file = await photo.get_file()
+            image_bytes = await photo_file.download_as_bytearray()
+            receipt_data = await extract_receipt_details(bytes(image_bytes))
+        else:
+            receipt_data = {"error": "Receipt check deferred", "degraded": True}
+
+        if receipt_data.get("degraded"):
+            # Can't read receipts right now: keep a pending sale pointing at the photo for the vendor to confirm
+            db.add(Sale(
                 vendor_id=session.vendor_id,
+                customer_name=customer_name,
+                receipt_url=f"telegram-file:{photo.file_id}",
                 status="Pending"
+            ))
+            db.commit()
+            confirmation = "Thank you! We've received your receipt. The vendor will confirm it shortly."
+        elif "error" in receipt_data:
+            await update.message.reply_text("I couldn't quite read that. Could you send a clearer photo?")
+            return
+        else:
+            amount = float(receipt_data.get('amount', 0))
+            order, _ = reconciler.settle_receipt(
+                db, session.vendor_id, amount, customer_number=chat_id,
+                sender_name=receipt_data.get('sender_name'), payment_ref=receipt_data.get('ref')
+            )
+            new_sale = Sale(
+                amount=amount,
+                customer_name=customer_name,
+                vendor_id=session.vendor_id,
+                order_id=order.id if order else None,
+                status="Verified" if order else "Pending"
             )
             db.add(new_sale)
             db.commit()
-            await update.message.reply_text(f"✅ Received! ₦{receipt_data.get('amount')} logged. The vendor has been notified.")
+            confirmation = f"✅ Received! ₦{receipt_data.get('amount')} logged. The vendor has been notified."
+
+        await update.message.reply_text(confirmation)
+        transcript_buffer.add(session.vendor_id, chat_id, "user", f"[receipt image telegram-file:{photo.file_id}]")
+        transcript_buffer.add(session.vendor_id, chat_id, "assistant", confirmation)
     except Exception as e:
         print(f"⚠️ Photo Logic Error: {e}")
     finally:
+        if mode != SHED:
+            admission.exit((time.perf_counter() - start) * 1000)
         db.close()
 
 # --- 4. INITIALIZATION ---
 TOKEN = os.getenv("TELEGRAM_TOKEN")
+# Optional: a local Bot API server or the offline benchmark stand-in
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE")
 
 if TOKEN:
-    bot_application = ApplicationBuilder().token(TOKEN).build()
+    builder = ApplicationBuilder().token(TOKEN)
+    if TELEGRAM_API_BASE:
+        builder = builder.base_url(f"{TELEGRAM_API_BASE}/bot").base_file_url(f"{TELEGRAM_API_BASE}/file/bot")
+    bot_application = builder.build()
     bot_application.add_handler(CommandHandler("start", start))
     bot_application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
     bot_application.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), handle_message))
@@ -1,62 +1,216 @@
-from typing import Annotated, TypedDict
+from typing import Annotated, Optional, TypedDict
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 from langgraph.checkpoint.memory import MemorySaver 
 from langchain_groq import ChatGroq
 from langchain_core.runnables import RunnableConfig
 import os
+import re
+import json
+import time
 from dotenv import load_dotenv
+from model_router import (
+    AUTO, FAST, LARGE, TIERS, CATALOG, CLASSIFIER, EXTRACTION, CLASSIFIER_PROMPT,
+    heuristic_route, first_token_logprob, parse_classifier_reply, routing_stats,
+)
+from resilience import breakers, CircuitOpenError
+from vendor_context import parse_catalog, catalog_digest, build_system_prompt, context_stats
 
 load_dotenv()
 
 class InawoState(TypedDict):
     # 'add_messages' ensures new messages are appended to the history automatically
     messages: Annotated[list, add_messages]
+    # Model tier chosen by the router node for the current turn
+    tier: str
+
+# Every Groq call is time-boxed and guarded by the shared 'groq' circuit breaker;
+# no client retries, so one call never runs past call_timeout (the tier fallback is the retry)
+groq_breaker = breakers["groq"]
+GROQ_CLIENT_OPTS = {"request_timeout": groq_breaker.call_timeout, "max_retries": 0, "groq_api_key": os.getenv("GROQ_API_KEY")}
 
 # Using Llama 3.3 70B for high-quality Nigerian context understanding
-llm = ChatGroq(model="llama-3.3-70b-specdec", groq_api_key=os.getenv("GROQ_API_KEY"))
+llm = ChatGroq(model=os.getenv("INAWO_LARGE_MODEL", "llama-3.3-70b-specdec"), **GROQ_CLIENT_OPTS)
+
+# Small, fast model for greetings, thanks and JSON extraction
+llm_fast = ChatGroq(model=os.getenv("INAWO_FAST_MODEL", "llama-3.1-8b-instant"), **GROQ_CLIENT_OPTS)
+
+# Same small model, capped to a one-word answer for routing; logprobs give the router its confidence
+llm_classifier = ChatGroq(
+    model=os.getenv("INAWO_FAST_MODEL", "llama-3.1-8b-instant"),
+    temperature=0,
+    max_tokens=4,
+    model_kwargs={"logprobs": True, "top_logprobs": 2},
+    **GROQ_CLIENT_OPTS
+)
+
+MODELS = {FAST: llm_fast, LARGE: llm}
+
+# Below this confidence the router sends the turn to the 70B model
+ROUTER_MIN_CONFIDENCE = float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.7"))
+
+def _last_user_text(messages) -> str:
+    for msg in reversed(messages):
+        if getattr(msg, "type", None) == "human":
+            return msg.content if isinstance(msg.content, str) else ""
+    return ""
+
+def _invoke_tier(tier: str, messages):
+    """Calls the model for a tier and records its latency."""
+    start = time.perf_counter()
+    response = groq_breaker.call(MODELS[tier].invoke, messages)
+    routing_stats.record_call(tier, (time.perf_counter() - start) * 1000)
+    return response
+
+def _classify_with_model(text: str):
+    """Second routing pass for turns the heuristics can't decide."""
+    start = time.perf_counter()
+    try:
+        reply = groq_breaker.call(llm_classifier.invoke, [{"role": "user", "content": CLASSIFIER_PROMPT + text}])
+        routing_stats.record_call(FAST, (time.perf_counter() - start) * 1000, kind=CLASSIFIER)
+        parsed = parse_classifier_reply(reply.content, first_token_logprob(reply.response_metadata))
+        if parsed is None:
+            return LARGE, 1.0, "classifier_parse_failure"
+        return parsed[0], parsed[1], "classifier"
+    except Exception as e:
+        print(f"⚠️ Router Classifier Error: {e}")
+        return LARGE, 1.0, "classifier_error"
+
+def router(state: InawoState, config: RunnableConfig):
+    """Picks the model tier for this turn: vendor override, heuristics, then the small classifier."""
+    configurable = config.get("configurable", {})
+    if configurable.get("is_ai_paused", False) or configurable.get("degraded", False):
+        return {"tier": LARGE}
+
+    override = configurable.get("model_tier") or AUTO
+    if override in TIERS:
+        routing_stats.record_decision("vendor_override")
+        return {"tier": override}
+
+    text = _last_user_text(state["messages"])
+    tier, confidence, reason = heuristic_route(text) or _classify_with_model(text)
+    if confidence < ROUTER_MIN_CONFIDENCE:
+        tier, reason = LARGE, "low_confidence"
+
+    routing_stats.record_decision(reason)
+    return {"tier": tier}
+
+# --- DEGRADED MODE (LLM unavailable or shedding load) ---
+
+def _words(text: Optional[str]) -> set:
+    return {w for w in re.findall(r"[a-z]+", (text or "").lower()) if len(w) > 2}
+
+def catalog_reply(text: str, knowledge: Optional[str], out_of_stock: Optional[str]) -> str:
+    """Best-effort answer without the LLM: a price lookup from the catalog, else a holding reply."""
+    asked = _words(text)
+    best, best_overlap = None, 0
+    for name, price in parse_catalog(knowledge):
+        overlap = len(asked & _words(name))
+        if overlap > best_overlap:
+            best, best_overlap = (name, price), overlap
+
+    if best:
+        name, price = best
+        sold_out = [_words(entry) for entry in re.split(r"[,\n;]", out_of_stock or "")]
+        if any(entry and entry <= _words(name) for entry in sold_out):
+            return f"Sorry, {name} is currently out of stock. We'll get back to you shortly with alternatives!"
+        return f"{name} is ₦{price:,.0f}. We'll get back to you shortly to complete your order!"
+    return "Thank you for your message! We'll get back to you shortly. 🙏"
 
 def assistant(state: InawoState, config: RunnableConfig):
     # 1. Access dynamic configuration from the database/webhook
     configurable = config.get("configurable", {})
     is_paused = configurable.get("is_ai_paused", False)
-    business_data = configurable.get("business_data", "A Nigerian Vendor")
-    out_of_stock = configurable.get("out_of_stock", "None")
+    # Precompiled per-vendor context (see vendor_context.chat_config); loose keys are the legacy path
+    ctx = configurable.get("vendor_context")
+    if ctx is not None:
+        knowledge, out_of_stock = ctx.knowledge, ctx.out_of_stock
+    else:
+        knowledge = configurable.get("knowledge")
+        out_of_stock = configurable.get("out_of_stock", "None")
 
     # 2. HUMAN TAKE-OVER (Silent Mode)
     if is_paused:
         # If the vendor has paused the AI, we return no messages
         return {"messages": []}
 
+    if configurable.get("degraded", False):
+        reply = catalog_reply(_last_user_text(state["messages"]), knowledge, out_of_stock)
+        routing_stats.record_turn(CATALOG)
+        return {"messages": [{"role": "assistant", "content": reply}]}
+
     # 3. AI PERSONALITY & RULES
-    # Optimized for speed and Nigerian business culture
-    system_msg = (
-        f"You are the AI Sales Assistant for {business_data}. "
-        f"IMPORTANT: The following items are currently OUT OF STOCK: {out_of_stock}. "
-        "Rules: "
-        "1. Max 2 sentences per reply. "
-        "2. Use friendly Nigerian business English (e.g., 'Welcome', 'Bless you'). "
-        "3. If an item is out of stock, suggest an alternative politely. "
-        "4. If the user sends an image/receipt, say 'I see your receipt! Verifying now...'"
-    )
+    # Stable prefix first (rules -> catalog -> stock), history after, so provider prompt caching applies
+    build_start = time.perf_counter()
+    if ctx is not None:
+        system_msg = ctx.system_prompt
+    else:
+        business_data = configurable.get("business_data", "A Nigerian Vendor")
+        system_msg = build_system_prompt(business_data, catalog_digest(knowledge), out_of_stock)
     
     # Combine system prompt with conversation history
     input_messages = [{"role": "system", "content": system_msg}] + state["messages"]
+    build_ms = (time.perf_counter() - build_start) * 1000
     
+    tier = state.get("tier") or LARGE
     try:
-        response = llm.invoke(input_messages)
+        try:
+            response = _invoke_tier(tier, input_messages)
+            if tier != LARGE and not str(response.content).strip():
+                raise ValueError("empty reply")
+        except Exception as e:
+            if tier == LARGE or isinstance(e, CircuitOpenError):
+                raise
+            # The small model failed this turn; the 70B model answers instead
+            print(f"⚠️ Fast tier failed, falling back to 70B: {e}")
+            routing_stats.record_fallback("fast_error")
+            tier = LARGE
+            response = _invoke_tier(LARGE, input_messages)
+        context_stats.record_turn(build_ms, getattr(response, "usage_metadata", None))
+        routing_stats.record_turn(tier)
         return {"messages": [response]}
     except Exception as e:
         print(f"❌ AI Logic Error: {e}")
-        return {"messages": [{"role": "assistant", "content": "I'm having a bit of trouble connecting. One moment please!"}]}
+        reply = catalog_reply(_last_user_text(state["messages"]), knowledge, out_of_stock)
+        routing_stats.record_turn(CATALOG)
+        return {"messages": [{"role": "assistant", "content": reply}]}
 
 # 4. CONSTRUCT THE GRAPH
 memory = MemorySaver()
 workflow = StateGraph(InawoState)
 
+workflow.add_node("router", router)
 workflow.add_node("assistant", assistant)
-workflow.add_edge(START, "assistant")
+workflow.add_edge(START, "router")
+workflow.add_edge("router", "assistant")
 workflow.add_edge("assistant", END)
 
 # The checkpointer (memory) allows the AI to remember the customer's name across messages
 inawo_app = workflow.compile(checkpointer=memory)
+
+
+# 5. ORDER EXTRACTION (outside the chat graph, no conversation memory needed)
+async def extract_order(text: str) -> Optional[dict]:
+    """
+    Pulls {"item", "total"} out of a customer message, or None if there is no purchase intent.
+    Runs on the fast tier and retries on the 70B model only if the reply isn't valid JSON.
+    """
+    prompt = (
+        f"Extract from: '{text}'. If purchase intent, return JSON: {{\"item\": str, \"total\": float}}. "
+        "Else return null. Return ONLY the JSON, no explanation."
+    )
+    for tier in (FAST, LARGE):
+        start = time.perf_counter()
+        try:
+            response = await groq_breaker.acall(MODELS[tier].ainvoke, [{"role": "user", "content": prompt}])
+            routing_stats.record_call(tier, (time.perf_counter() - start) * 1000, kind=EXTRACTION)
+            data = json.loads(re.sub(r'```(?:json)?|```', '', response.content).strip())
+            return data if isinstance(data, dict) else None
+        except CircuitOpenError:
+            return None
+        except Exception as e:
+            if tier == FAST:
+                routing_stats.record_fallback("extraction_fast_failed")
+                continue
+            print(f"❌ Order Extraction Error: {e}")
+    return None
@@ -1,25 +1,36 @@
 import os
+import io
 import json
+import time
 import asyncio
-from typing import List
+import pandas as pd
+from collections import OrderedDict
+from typing import List, Optional
 from fastapi import FastAPI, Request, UploadFile, File, Form, Depends, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, cast, Date
+from sqlalchemy import func, cast, Date, and_, or_
 from datetime import datetime, timedelta, timezone
 
 # --- INTERNAL IMPORTS ---
 from database import get_db, engine
 import models
-from security import hash_password, verify_password, create_access_token
-from dependencies import get_current_vendor 
+from security import hash_password, verify_password, create_access_token, encrypt_secret
+from dependencies import get_current_vendor, require_ops_token
 from pydantic import BaseModel
 from auth_routes import router as auth_router
 
 # --- AI & MESSAGING SERVICES ---
-from whatsapp_service import send_whatsapp_message, get_whatsapp_media_bytes
+from whatsapp_service import send_whatsapp_message, get_whatsapp_media_bytes, verify_phone_number, PHONE_NUMBER_ID
+from tenant_routing import whatsapp_tenants
 from vision_service import extract_receipt_details
-from inawo_logic import inawo_app
+from inawo_logic import inawo_app, extract_order
+from model_router import TIERS, AUTO, routing_stats
+from transcript_buffer import transcript_buffer
+from reconciliation import reconciler
+from resilience import admission, breakers, resilience_snapshot, CircuitOpenError, SHED, DEGRADE, OPEN
+from vendor_context import chat_config, vendor_contexts, context_stats
 
 # 1. Initialize Database Tables
 models.Base.metadata.create_all(bind=engine)
@@ -42,6 +53,13 @@ app.include_router(auth_router)
 class InventoryUpdate(BaseModel):
     items: str
 
+class WhatsAppCredentials(BaseModel):
+    phone_number_id: str
+    access_token: str
+
+class ModelTierUpdate(BaseModel):
+    tier: str # 'auto', 'fast' or 'large'
+
 # --- HEALTH CHECK ---
 @app.get("/")
 async def root():
@@ -57,7 +75,36 @@ async def verify_webhook(mode: str = Query(None, alias="hub.mode"), token: str =
 
 @app.post("/webhook")
 async def handle_whatsapp_webhook(request: Request, db: Session = Depends(get_db)):
-    data = await request.json()
+    # Replies can't go out while the Graph API breaker is open: a non-200 makes Meta redeliver later
+    if breakers["graph"].state == OPEN:
+        return JSONResponse({"status": "deferred"}, status_code=503)
+
+    # Admission control: shedding defers rather than drops, for the same reason
+    mode = admission.enter()
+    if mode == SHED:
+        return JSONResponse({"status": "deferred"}, status_code=503)
+
+    start = time.perf_counter()
+    try:
+        result = await process_whatsapp_payload(await request.json(), db, degraded=(mode == DEGRADE))
+        if result.get("status") == "deferred":
+            return JSONResponse(result, status_code=503)
+        return result
+    finally:
+        admission.exit((time.perf_counter() - start) * 1000)
+
+# Ids of messages already answered: a deferred (503) delivery comes back whole, so skip what went out the first time
+HANDLED_MESSAGE_IDS: "OrderedDict[str, None]" = OrderedDict()
+MAX_HANDLED_MESSAGE_IDS = 10000
+
+def mark_handled(message_id: Optional[str]):
+    if message_id:
+        HANDLED_MESSAGE_IDS[message_id] = None
+        while len(HANDLED_MESSAGE_IDS) > MAX_HANDLED_MESSAGE_IDS:
+            HANDLED_MESSAGE_IDS.popitem(last=False)
+
+async def process_whatsapp_payload(data: dict, db: Session, degraded: bool = False):
+    """Handles one webhook delivery. `degraded` answers from the catalog without calling the LLMs."""
     try:
         if data.get("object") == "whatsapp_business_account":
             for entry in data.get("entry", []):
@@ -66,60 +113,113 @@ async def handle_whatsapp_webhook(request: Request, db: Session = Depends(get_db
                     if "messages" in val:
                         msg = val["messages"][0]
                         sender = msg["from"]
+                        if msg.get("id") in HANDLED_MESSAGE_IDS:
+                            continue
+
+                        # A. Tenant Routing: the business number that received the message picks the vendor
+                        phone_number_id = val.get("metadata", {}).get("phone_number_id")
+                        tenant = whatsapp_tenants.resolve(db, phone_number_id)
+                        if not tenant and phone_number_id and phone_number_id != PHONE_NUMBER_ID:
+                            print(f"⚠️ Webhook for unregistered phone_number_id {phone_number_id}")
+                            continue
+
+                        # B. Auto-Session: one per (vendor, customer), so takeover flags and names stay with their vendor
+                        sessions = db.query(models.ChatSession).filter(models.ChatSession.customer_number == sender)
+                        if tenant:
+                            vendor_id = tenant.vendor_id
+                            session = sessions.filter(models.ChatSession.vendor_id == vendor_id).first()
+                        else:
+                            # Shared env number falls back to the Free Version Logic: the customer's latest vendor
+                            session = sessions.order_by(
+                                models.ChatSession.last_opened_at.desc().nullslast(), models.ChatSession.id.desc()
+                            ).first()
+                            if session:
+                                vendor_id = session.vendor_id
+                            else:
+                                vendor = db.query(models.Vendor).first() # Auto-assign to first vendor
+                                if not vendor: return {"status": "no_vendors"}
+                                vendor_id = vendor.id
 
-                        # A. Auto-Session (Free Version Logic)
-                        session = db.query(models.ChatSession).filter(models.ChatSession.customer_number == sender).first()
+                        # WhatsApp profile name, matched against receipt senders and statement narrations
+                        profile_name = next(
+                            (c.get("profile", {}).get("name") for c in val.get("contacts", []) if c.get("wa_id") == sender),
+                            None
+                        )
                         if not session:
-                            vendor = db.query(models.Vendor).first() # Auto-assign to first vendor
-                            if not vendor: return {"status": "no_vendors"}
-                            session = models.ChatSession(customer_number=sender, vendor_id=vendor.id)
+                            session = models.ChatSession(customer_number=sender, vendor_id=vendor_id, customer_name=profile_name)
                             db.add(session); db.commit()
+                        elif profile_name and session.customer_name != profile_name:
+                            session.customer_name = profile_name
+                            db.commit()
+                            # Pending orders were indexed under the old name
+                            reconciler.index.invalidate(vendor_id)
 
-                        vendor = db.query(models.Vendor).get(session.vendor_id)
+                        vendor = db.query(models.Vendor).get(vendor_id)
+                        # Reply from the number the customer wrote to (env credentials otherwise)
+                        send_as = {"phone_number_id": tenant.phone_number_id, "token": tenant.token} if tenant else {}
 
-                        # B. Image/Receipt Processing
+                        # C. Image/Receipt Processing
                         if msg.get("type") == "image":
                             media_id = msg["image"]["id"]
-                            img_bytes = await get_whatsapp_media_bytes(media_id)
-                            receipt = await extract_receipt_details(img_bytes)
+                            img_bytes = None if degraded else await get_whatsapp_media_bytes(media_id, token=send_as.get("token"))
+                            transcript_buffer.add(vendor.id, sender, "user", f"[receipt image whatsapp-media:{media_id}]")
+                            # The receipt is stored below before the ack goes out, so a redelivery must not store it again
+                            mark_handled(msg.get("id"))
+                            if img_bytes:
+                                receipt = await extract_receipt_details(img_bytes)
+                            else:
+                                receipt = {"error": "Receipt check deferred", "degraded": True}
                             
                             if "amount" in receipt and not receipt.get("error"):
-                                # Mark latest pending order as paid
-                                order = db.query(models.Order).filter(
-                                    models.Order.customer_number == sender, 
-                                    models.Order.status == "pending"
-                                ).order_by(models.Order.created_at.desc()).first()
+                                # Match by amount, time window and sender name instead of "latest pending"
+                                order, _ = reconciler.settle_receipt(
+                                    db, vendor.id, float(receipt["amount"]), customer_number=sender,
+                                    sender_name=receipt.get("sender_name"), payment_ref=receipt.get("ref")
+                                )
                                 
                                 if order:
-                                    order.status = "paid"
                                     db.commit()
-                                    await send_whatsapp_message(sender, f"✅ Receipt for ₦{receipt['amount']} verified! Your order is being processed.")
+                                    confirmation = f"✅ Receipt for ₦{receipt['amount']} verified! Your order is being processed."
+                                else:
+                                    # No confident match: leave the order pending for the vendor to confirm
+                                    confirmation = f"Thank you! We've received your receipt for ₦{receipt['amount']}. The vendor will confirm it shortly."
+                                if await send_whatsapp_message(sender, confirmation, **send_as):
+                                    transcript_buffer.add(vendor.id, sender, "assistant", confirmation)
+                            elif receipt.get("degraded"):
+                                # Can't read receipts right now: keep a pending sale pointing at the media for the vendor to confirm
+                                db.add(models.Sale(
+                                    vendor_id=vendor.id,
+                                    customer_name=session.customer_name or sender,
+                                    receipt_url=f"whatsapp-media:{media_id}",
+                                    status="Pending"
+                                ))
+                                db.commit()
+                                confirmation = "Thank you! We've received your receipt. The vendor will confirm it shortly."
+                                if await send_whatsapp_message(sender, confirmation, **send_as):
+                                    transcript_buffer.add(vendor.id, sender, "assistant", confirmation)
                             return {"status": "success"}
 
-                        # C. Text/AI Sales Assistant
+                        # D. Text/AI Sales Assistant
                         elif msg.get("type") == "text":
                             text = msg["text"]["body"]
                             
-                            # Config for the LangGraph Brain
-                            config = {
-                                "configurable": {
-                                    "thread_id": sender,
-                                    "business_data": vendor.business_name,
-                                    "knowledge": vendor.knowledge_base_text,
-                                    "out_of_stock": vendor.out_of_stock_items or "None"
-                                }
-                            }
+                            # Config for the LangGraph Brain (cached per vendor until its context_version changes)
+                            config = chat_config(vendor, f"{vendor.id}:{sender}", degraded=degraded)
                             
                             # 1. Generate AI Response
                             result = await inawo_app.ainvoke({"messages": [("user", text)]}, config)
                             reply = result["messages"][-1].content
-                            await send_whatsapp_message(sender, reply)
+                            # Logged after the send, so a deferred (redelivered) turn isn't logged twice;
+                            # only what actually reached the customer goes in as the assistant turn
+                            sent = await send_whatsapp_message(sender, reply, **send_as)
+                            transcript_buffer.add(vendor.id, sender, "user", text)
+                            if sent:
+                                transcript_buffer.add(vendor.id, sender, "assistant", reply)
+                            mark_handled(msg.get("id"))
 
-                            # 2. Automated Order Creation (Silent Extraction)
-                            ext_p = f"Extract from: '{text}'. If purchase intent, return JSON: {{\"item\": str, \"total\": float}}. Else return null."
-                            ext_res = await inawo_app.ainvoke([("system", ext_p)])
+                            # 2. Automated Order Creation (Silent Extraction on the fast tier)
                             try:
-                                o_data = json.loads(ext_res["messages"][-1].content)
+                                o_data = None if degraded else await extract_order(text)
                                 if o_data and o_data.get("item"):
                                     new_order = models.Order(
                                         vendor_id=vendor.id, 
@@ -128,9 +228,14 @@ async def handle_whatsapp_webhook(request: Request, db: Session = Depends(get_db
                                         amount=o_data.get('total', 0)
                                     )
                                     db.add(new_order); db.commit()
+                                    reconciler.index.add_order(new_order, session.customer_name)
                             except: pass
 
         return {"status": "success"}
+    except CircuitOpenError as e:
+        # The Graph API breaker opened mid-delivery: have Meta redeliver instead of dropping replies
+        print(f"⚠️ Webhook deferred: {e}")
+        return {"status": "deferred"}
     except Exception as e:
         print(f"❌ Webhook Logic Error: {e}")
         return {"status": "error"}
@@ -159,11 +264,111 @@ async def update_inventory(data: InventoryUpdate, db: Session = Depends(get_db),
     db.commit()
     return {"status": "success"}
 
+@app.post("/vendor/reconcile/statement")
+async def reconcile_statement(file: UploadFile = File(...), db: Session = Depends(get_db), curr: models.Vendor = Depends(get_current_vendor)):
+    """Match a bank statement (CSV/Excel) against all pending orders in one pass."""
+    content = await file.read()
+    try:
+        if file.filename.lower().endswith((".xlsx", ".xls")):
+            statement = pd.read_excel(io.BytesIO(content))
+        else:
+            statement = pd.read_csv(io.BytesIO(content))
+        return reconciler.reconcile_statement(db, curr.id, statement)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Could not read statement: {e}")
+
+@app.post("/vendor/whatsapp")
+async def update_whatsapp_credentials(data: WhatsAppCredentials, db: Session = Depends(get_db), curr: models.Vendor = Depends(get_current_vendor)):
+    """Connect the vendor's own WhatsApp Business number."""
+    taken = db.query(models.Vendor).filter(
+        models.Vendor.whatsapp_phone_number_id == data.phone_number_id,
+        models.Vendor.id != curr.id
+    ).first()
+    if taken:
+        raise HTTPException(status_code=400, detail="This WhatsApp number is already connected to another business")
+    # Only the number's owner can read it with their token; stops vendors claiming someone else's number
+    if not await verify_phone_number(data.phone_number_id, data.access_token):
+        raise HTTPException(status_code=400, detail="Could not verify this WhatsApp number with the access token provided")
+    curr.whatsapp_phone_number_id = data.phone_number_id
+    curr.whatsapp_token = encrypt_secret(data.access_token)
+    db.commit()
+    whatsapp_tenants.invalidate()
+    return {"status": "success", "phone_number_id": curr.whatsapp_phone_number_id}
+
+@app.post("/vendor/model-tier")
+async def update_model_tier(data: ModelTierUpdate, db: Session = Depends(get_db), curr: models.Vendor = Depends(get_current_vendor)):
+    """Pin this vendor's chats to one model tier, or 'auto' to let the router decide."""
+    if data.tier != AUTO and data.tier not in TIERS:
+        raise HTTPException(status_code=400, detail=f"Tier must be one of: {AUTO}, {', '.join(TIERS)}")
+    curr.model_tier = data.tier
+    db.commit()
+    return {"status": "success", "tier": curr.model_tier}
+
+# Plain def: the flush lock and DB read block, so this runs in FastAPI's threadpool, not on the event loop
+@app.get("/vendor/transcripts/{customer_number}")
+def get_transcript(
+    customer_number: str,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[datetime] = Query(None, description="Cursor: created_at of the oldest message already shown"),
+    before_id: Optional[int] = Query(None, description="Cursor: id of that message (empty while it was still buffered)"),
+    db: Session = Depends(get_db),
+    curr: models.Vendor = Depends(get_current_vendor)
+):
+    """One customer's chat history, newest first, paged by (`before`, `before_id`)."""
+    def load_rows():
+        query = db.query(models.ChatMessage).filter(
+            models.ChatMessage.vendor_id == curr.id,
+            models.ChatMessage.sender == customer_number
+        )
+        if before is not None:
+            older = models.ChatMessage.created_at < before
+            if before_id is not None:
+                older = or_(older, and_(models.ChatMessage.created_at == before, models.ChatMessage.id < before_id))
+            query = query.filter(older)
+        return query.order_by(models.ChatMessage.created_at.desc(), models.ChatMessage.id.desc()).limit(limit).all()
+
+    # Snapshot the write-behind buffer and the DB together so a concurrent flush can't duplicate or hide a turn
+    pending, rows = transcript_buffer.read_through(curr.id, customer_number, load_rows)
+
+    # Buffered turns are always newer than flushed ones
+    cutoff = before.replace(tzinfo=before.tzinfo or timezone.utc) if before is not None else None
+    page = [
+        {"id": None, "sender": r["sender"], "role": r["role"], "content": r["content"], "created_at": r["created_at"]}
+        for r in reversed(pending)
+        if cutoff is None or r["created_at"] < cutoff
+    ]
+    page += [{"id": m.id, "sender": m.sender, "role": m.role, "content": m.content, "created_at": m.created_at} for m in rows]
+    page = page[:limit]
+
+    last = page[-1] if len(page) == limit else None
+    return {
+        "messages": page,
+        "next_before": last["created_at"] if last else None,
+        "next_before_id": last["id"] if last else None
+    }
+
 @app.get("/vendor/telegram-link")
 async def get_telegram_link(curr: models.Vendor = Depends(get_current_vendor)):
     """Generate the deep-link for the Telegram Bot."""
     return {"link": f"https://t.me/Inawo_Bot?start=v_{curr.id}"}
 
+# --- OPERATIONS ---
+
+@app.get("/ops/resilience", dependencies=[Depends(require_ops_token)])
+async def get_resilience():
+    """Circuit breaker states and admission control (in-flight work, p99, shed/degrade counts)."""
+    return resilience_snapshot()
+
+@app.get("/ops/prompt-context", dependencies=[Depends(require_ops_token)])
+async def get_prompt_context():
+    """Compiled vendor context cache and prompt build time / billed tokens."""
+    return {"cache": vendor_contexts.snapshot(), "prompts": context_stats.snapshot()}
+
+@app.get("/ops/llm-routing", dependencies=[Depends(require_ops_token)])
+async def get_llm_routing():
+    """Share of turns answered by each tier, plus LLM calls (chat, classifier, extraction) and their latency."""
+    return routing_stats.snapshot()
+
 # --- SAFE STARTUP (Render Support) ---
 
 @app.on_event("startup")
@@ -184,8 +389,14 @@ async def startup_event():
             except Exception as e:
                 print(f"❌ Bot Startup Failure: {e}")
 
+    transcript_buffer.start()
     asyncio.create_task(delayed_bot_start())
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Drains buffered chat transcripts before the process exits."""
+    await transcript_buffer.stop()
+
 if __name__ == "__main__":
     import uvicorn
     # Use environment port for Render/Heroku
@@ -0,0 +1,6 @@
+def percentile(samples, pct: float, digits: int = 2) -> float:
+    """Nearest-rank percentile of an already sorted sequence; 0.0 when empty."""
+    if not samples:
+        return 0.0
+    idx = min(len(samples) - 1, max(0, int(round(pct / 100 * len(samples))) - 1))
+    return round(samples[idx], digits)
@@ -0,0 +1,163 @@
+import math
+import re
+import threading
+from collections import Counter, deque
+from typing import Optional, Tuple
+
+from metrics import percentile
+
+# Model tiers: FAST handles greetings/small talk/JSON extraction, LARGE everything else
+FAST = "fast"
+LARGE = "large"
+AUTO = "auto"
+TIERS = (FAST, LARGE)
+# Turns answered from the catalog without any model (LLM errors, degraded mode)
+CATALOG = "catalog"
+
+# What an LLM call was for: the turn's reply, the router's classifier, or order extraction
+CHAT = "chat"
+CLASSIFIER = "classifier"
+EXTRACTION = "extraction"
+CALL_KINDS = (CHAT, CLASSIFIER, EXTRACTION)
+
+# Turns that never need the 70B model
+EASY_TURN = re.compile(
+    r"^\s*(hi+|hello+|hey+|good (morning|afternoon|evening|night)|how far|ok(ay)?|alright|"
+    r"thanks?( you| so much)?|thank you( so much)?|bless you|noted|cool|sure|yes|no)[\s!.?🙏👍😊]*$",
+    re.IGNORECASE,
+)
+
+# Negotiation, complaints and multi-item orders need the stronger model
+HARD_HINTS = (
+    "reduce", "discount", "last price", "refund", "complain", "wrong", "not happy",
+    "cancel", "exchange", "return", "delay", "still waiting", "and also",
+)
+MAX_FAST_WORDS = 40
+
+CLASSIFIER_PROMPT = (
+    "You route customer messages for a Nigerian online shop. "
+    "Reply with exactly one word: SIMPLE if the message is a greeting, thanks, a yes/no, "
+    "or a single price/availability question; COMPLEX for negotiation, complaints, "
+    "multi-item orders or anything needing careful reasoning.\n\nMessage: "
+)
+
+# Used when the provider returns no logprobs: below any sane ROUTER_MIN_CONFIDENCE,
+# so an unscored verdict never keeps a turn on the small model
+UNSCORED_CONFIDENCE = 0.5
+
+
+def heuristic_route(text: str) -> Optional[Tuple[str, float, str]]:
+    """
+    Cheap local pass. Returns (tier, confidence, reason) or None when the
+    turn is ambiguous and should go to the classifier model.
+    """
+    text = (text or "").strip()
+    if not text:
+        return FAST, 0.9, "empty"
+    if EASY_TURN.match(text):
+        return FAST, 0.95, "heuristic_easy"
+
+    lowered = text.lower()
+    if len(text.split()) > MAX_FAST_WORDS or any(hint in lowered for hint in HARD_HINTS):
+        return LARGE, 0.9, "heuristic_hard"
+    return None
+
+
+def first_token_logprob(response_metadata: Optional[dict]) -> Optional[float]:
+    """Log-probability of the classifier's first output token, if the provider sent it."""
+    content = ((response_metadata or {}).get("logprobs") or {}).get("content") or []
+    if not content or content[0].get("logprob") is None:
+        return None
+    return float(content[0]["logprob"])
+
+
+def parse_classifier_reply(reply: str, logprob: Optional[float] = None) -> Optional[Tuple[str, float]]:
+    """
+    Maps the classifier's one-word answer to (tier, confidence); None on parse
+    failure. Confidence is the model's own probability for the first token of
+    its verdict, which is where SIMPLE and COMPLEX diverge.
+    """
+    word = (reply or "").strip().strip(".!\"'`").upper()
+    if word.startswith("SIMPLE"):
+        tier = FAST
+    elif word.startswith("COMPLEX"):
+        tier = LARGE
+    else:
+        return None
+    confidence = math.exp(logprob) if logprob is not None else UNSCORED_CONFIDENCE
+    return tier, round(confidence, 4)
+
+
+class RoutingStats:
+    """
+    Thread-safe routing counters. Turns are counted once, by whichever tier
+    finally answered; LLM calls (chat, classifier, extraction) are counted
+    separately with per-tier latency (bounded samples).
+    """
+
+    def __init__(self, max_samples: int = 1000):
+        self._lock = threading.Lock()
+        self._turns = Counter()
+        self._calls = Counter()
+        self._reasons = Counter()
+        self._fallbacks = Counter()
+        self._latency = {(kind, tier): deque(maxlen=max_samples) for kind in CALL_KINDS for tier in TIERS}
+
+    def record_decision(self, reason: str):
+        with self._lock:
+            self._reasons[reason] += 1
+
+    def record_turn(self, answered_by: str):
+        """One customer turn, attributed to the tier (or CATALOG) whose reply was sent."""
+        with self._lock:
+            self._turns[answered_by] += 1
+
+    def record_call(self, tier: str, latency_ms: float, kind: str = CHAT):
+        with self._lock:
+            self._calls[(kind, tier)] += 1
+            self._latency[(kind, tier)].append(latency_ms)
+
+    def record_fallback(self, cause: str):
+        with self._lock:
+            self._fallbacks[cause] += 1
+
+    def reset(self):
+        with self._lock:
+            self._turns.clear()
+            self._calls.clear()
+            self._reasons.clear()
+            self._fallbacks.clear()
+            for samples in self._latency.values():
+                samples.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            turns = sum(self._turns.values())
+            answered = {
+                source: {
+                    "turns": self._turns[source],
+                    "share": round(self._turns[source] / turns, 3) if turns else 0.0,
+                }
+                for source in TIERS + (CATALOG,)
+            }
+            calls = {}
+            for kind in CALL_KINDS:
+                calls[kind] = {}
+                for tier in TIERS:
+                    samples = sorted(self._latency[(kind, tier)])
+                    calls[kind][tier] = {
+                        "calls": self._calls[(kind, tier)],
+                        "p50_ms": percentile(samples, 50),
+                        "p95_ms": percentile(samples, 95),
+                    }
+            return {
+                "turns": turns,
+                "answered_by": answered,
+                "llm_calls": sum(self._calls.values()),
+                "calls": calls,
+                "decisions": dict(self._reasons),
+                "fallbacks": dict(self._fallbacks),
+            }
+
+
+routing_stats = RoutingStats()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, Text, DateTime
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, Text, DateTime, Index, UniqueConstraint
 from sqlalchemy.orm import relationship, declarative_base
 from datetime import datetime, timezone
 
@@ -24,9 +24,15 @@ class Vendor(Base):
     # AI Knowledge & Inventory
     out_of_stock_items = Column(Text, nullable=True, default="") 
     knowledge_base_text = Column(Text, nullable=True)
+    model_tier = Column(String(10), default="auto") # 'auto', 'fast' or 'large'
+    context_version = Column(Integer, default=1) # Bumped on writes that change the AI prompt
     
     # Identity & Notifications
     telegram_chat_id = Column(String(50), nullable=True)
+    
+    # WhatsApp Business number (inbound routing + outbound sender identity)
+    whatsapp_phone_number_id = Column(String(50), unique=True, nullable=True)
+    whatsapp_token = Column(String(500), nullable=True)
     is_verified = Column(Boolean, default=False)
     
     # Relationships
@@ -37,7 +43,7 @@ class Vendor(Base):
 class ChatSession(Base):
     __tablename__ = 'chat_sessions'
     id = Column(Integer, primary_key=True)
-    customer_number = Column(String(20), unique=True, nullable=False)
+    customer_number = Column(String(20), nullable=False)
     vendor_id = Column(Integer, ForeignKey('vendors.id'))
     
     # AI Logic State
@@ -46,6 +52,14 @@ class ChatSession(Base):
     delivery_address = Column(Text, nullable=True)
     
     updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    # When the customer last opened a chat with this vendor (vendor link / first message); only set explicitly,
+    # so unrelated writes like a takeover toggle never change which vendor a shared channel talks to
+    last_opened_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    # One session per customer per vendor; customer_number leads so lookups by number alone use it too
+    __table_args__ = (
+        UniqueConstraint("customer_number", "vendor_id", name="uq_chat_sessions_customer_vendor"),
+    )
 
 class ChatMessage(Base):
     __tablename__ = 'chat_messages'
@@ -58,6 +72,11 @@ class ChatMessage(Base):
     
     vendor = relationship("Vendor", back_populates="messages")
 
+    # Transcript pages are read per vendor + customer, newest first
+    __table_args__ = (
+        Index("ix_chat_messages_vendor_sender_created", "vendor_id", "sender", "created_at"),
+    )
+
 class Order(Base):
     __tablename__ = 'orders'
     id = Column(Integer, primary_key=True)
@@ -68,6 +87,10 @@ class Order(Base):
     status = Column(String(20), default="pending") 
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     
+    # Payment Reconciliation (set when a receipt or statement line is matched)
+    match_confidence = Column(Float, nullable=True)
+    payment_ref = Column(String(100), nullable=True)
+    
     vendor = relationship("Vendor", back_populates="orders")
 
 class Sale(Base):
@@ -77,6 +100,7 @@ class Sale(Base):
     amount = Column(Float)
     customer_name = Column(String(100))
     receipt_url = Column(String(255), nullable=True) 
+    order_id = Column(Integer, ForeignKey('orders.id'), nullable=True)
     status = Column(String(20), default="Pending")
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     
@@ -0,0 +1,366 @@
+import os
+import re
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
+
+from models import ChatSession, Order
+
+# Matching rules (overridable per deployment)
+AMOUNT_TOLERANCE_ABS = float(os.getenv("RECON_AMOUNT_TOLERANCE_ABS", "100"))   # Naira
+AMOUNT_TOLERANCE_PCT = float(os.getenv("RECON_AMOUNT_TOLERANCE_PCT", "0.01"))  # 1% of the order
+MATCH_WINDOW = timedelta(hours=float(os.getenv("RECON_WINDOW_HOURS", "72")))
+# Below this a match is reported but the order is not marked paid
+MIN_CONFIDENCE = float(os.getenv("RECON_MIN_CONFIDENCE", "0.6"))
+
+# Header aliases seen on Nigerian bank statement exports
+CREDIT_COLUMNS = ("credit", "credit amount", "credits", "deposit", "deposits", "cr", "amount")
+DATE_COLUMNS = ("date", "transaction date", "trans date", "value date", "posted date", "txn date")
+NARRATION_COLUMNS = ("narration", "description", "details", "remarks", "transaction details")
+
+
+class Match(NamedTuple):
+    order_id: int
+    customer_number: str
+    amount: float
+    confidence: float
+
+
+def _utc(dt: Optional[datetime]) -> datetime:
+    if dt is None:
+        return datetime.now(timezone.utc)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _name_tokens(name: Optional[str]) -> set:
+    if not isinstance(name, str):  # None, or NaN out of a DataFrame
+        return set()
+    return {t for t in re.split(r"[^a-z]+", name.lower()) if len(t) > 1}
+
+
+def _token_score(ta: set, tb: set) -> float:
+    if not ta or not tb:
+        return 0.5
+    return len(ta & tb) / min(len(ta), len(tb))
+
+
+def name_score(a: Optional[str], b: Optional[str]) -> float:
+    """Token overlap between two names; 0.5 (neutral) when either is unknown."""
+    return _token_score(_name_tokens(a), _name_tokens(b))
+
+
+def amount_tolerance(amount: float) -> float:
+    return max(AMOUNT_TOLERANCE_ABS, AMOUNT_TOLERANCE_PCT * amount)
+
+
+def score(order_amount, paid_amount, age: timedelta, names: float) -> float:
+    """Weighted confidence: amount closeness dominates, then recency, then sender name."""
+    amount_fit = max(0.0, 1 - abs(order_amount - paid_amount) / amount_tolerance(order_amount))
+    recency = max(0.0, 1 - max(age, timedelta(0)) / MATCH_WINDOW)
+    return round(0.6 * amount_fit + 0.25 * recency + 0.15 * names, 3)
+
+
+class _Entry(NamedTuple):
+    amount: float
+    created_at: datetime
+    order_id: int
+    customer_number: str
+    customer_name: Optional[str]
+
+
+class PendingOrderIndex:
+    """
+    In-memory index of pending orders, kept per vendor and per (vendor, customer),
+    each sorted by (amount, created_at) so amount-window lookups are a bisect.
+    Vendors are loaded lazily from the DB on first use and kept in sync by
+    `add_order()` / `remove_order()`.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._by_vendor: Dict[int, List[_Entry]] = {}
+        self._by_customer: Dict[Tuple[int, str], List[_Entry]] = {}
+        self._entries: Dict[int, _Entry] = {}
+
+    # --- MAINTENANCE ---
+
+    def ensure_loaded(self, db: Session, vendor_id: int):
+        with self._lock:
+            if vendor_id in self._by_vendor:
+                return
+        rows = db.query(Order, ChatSession.customer_name).outerjoin(
+            ChatSession,
+            (ChatSession.customer_number == Order.customer_number) & (ChatSession.vendor_id == Order.vendor_id)
+        ).filter(Order.vendor_id == vendor_id, Order.status == "pending", Order.amount > 0).all()
+
+        with self._lock:
+            self._by_vendor[vendor_id] = []
+            for order, customer_name in rows:
+                self._insert(vendor_id, _Entry(
+                    order.amount, _utc(order.created_at), order.id, order.customer_number, customer_name
+                ))
+
+    def invalidate(self, vendor_id: int):
+        """Forces a reload, e.g. after orders were written outside this process."""
+        with self._lock:
+            for entry in self._by_vendor.pop(vendor_id, []):
+                self._entries.pop(entry.order_id, None)
+            for key in [k for k in self._by_customer if k[0] == vendor_id]:
+                del self._by_customer[key]
+
+    def add_order(self, order: Order, customer_name: Optional[str] = None):
+        """Indexes a newly created pending order (no-op until the vendor is loaded)."""
+        if not order.amount or order.amount <= 0:
+            return
+        with self._lock:
+            if order.vendor_id in self._by_vendor:
+                self._insert(order.vendor_id, _Entry(
+                    order.amount, _utc(order.created_at), order.id, order.customer_number, customer_name
+                ))
+
+    def remove_order(self, vendor_id: int, order_id: int):
+        with self._lock:
+            entry = self._entries.pop(order_id, None)
+            if entry is None:
+                return
+            for bucket in (self._by_vendor.get(vendor_id), self._by_customer.get((vendor_id, entry.customer_number))):
+                if bucket:
+                    i = bisect_left(bucket, entry)
+                    if i < len(bucket) and bucket[i] == entry:
+                        del bucket[i]
+
+    def _insert(self, vendor_id: int, entry: _Entry):
+        self._entries[entry.order_id] = entry
+        insort(self._by_vendor[vendor_id], entry)
+        insort(self._by_customer.setdefault((vendor_id, entry.customer_number), []), entry)
+
+    # --- LOOKUPS ---
+
+    def candidates(self, vendor_id: int, amount: float, customer_number: Optional[str] = None) -> List[_Entry]:
+        """Pending orders whose amount is within tolerance of `amount` (O(log n + k))."""
+        with self._lock:
+            bucket = self._by_customer.get((vendor_id, customer_number)) if customer_number else self._by_vendor.get(vendor_id)
+            if not bucket:
+                return []
+            # Tolerance scales with the order amount; this bounds the largest order that could fit
+            slack = amount_tolerance((amount + AMOUNT_TOLERANCE_ABS) / (1 - AMOUNT_TOLERANCE_PCT))
+            lo = bisect_left(bucket, (amount - slack,))
+            hi = bisect_right(bucket, (amount + slack, datetime.max.replace(tzinfo=timezone.utc)))
+            return [e for e in bucket[lo:hi] if abs(e.amount - amount) <= amount_tolerance(e.amount)]
+
+    def pending_frame(self, vendor_id: int) -> pd.DataFrame:
+        """The vendor's pending orders as a frame, sorted by (amount, created_at)."""
+        with self._lock:
+            entries = list(self._by_vendor.get(vendor_id, []))
+        return pd.DataFrame(entries, columns=list(_Entry._fields))
+
+
+class Reconciler:
+    """Matches payment evidence (receipts, statement lines) to pending orders."""
+
+    def __init__(self):
+        self.index = PendingOrderIndex()
+
+    def match_receipt(self, db: Session, vendor_id: int, amount: float, customer_number: Optional[str] = None,
+                      sender_name: Optional[str] = None, paid_at: Optional[datetime] = None) -> Optional[Match]:
+        """
+        Best pending order for one receipt. Looks at the customer's own orders
+        first and only falls back to the whole vendor when a sender name is known.
+        """
+        self.index.ensure_loaded(db, vendor_id)
+        paid_at = _utc(paid_at)
+
+        pools = [customer_number] if customer_number else []
+        if sender_name or not customer_number:
+            pools.append(None)
+
+        for pool in pools:
+            best = None
+            for e in self.index.candidates(vendor_id, amount, pool):
+                age = paid_at - e.created_at
+                if age > MATCH_WINDOW or age < -timedelta(minutes=5):
+                    continue
+                names = name_score(sender_name, e.customer_name)
+                # Another customer's order needs the name to actually agree
+                if pool is None and e.customer_number != customer_number and names <= 0.5:
+                    continue
+                confidence = score(e.amount, amount, age, names)
+                if best is None or confidence > best.confidence:
+                    best = Match(e.order_id, e.customer_number, e.amount, confidence)
+            if best:
+                return best
+        return None
+
+    def settle_receipt(self, db: Session, vendor_id: int, amount: float, customer_number: Optional[str] = None,
+                       sender_name: Optional[str] = None, payment_ref: Optional[str] = None) -> Tuple[Optional[Order], Optional[Match]]:
+        """Matches a receipt and marks the order paid only if the match is confident (caller commits)."""
+        match = self.match_receipt(db, vendor_id, amount, customer_number, sender_name)
+        if match is None or match.confidence < MIN_CONFIDENCE:
+            return None, match
+        return self.mark_paid(db, vendor_id, match, payment_ref), match
+
+    def mark_paid(self, db: Session, vendor_id: int, match: Match, payment_ref: Optional[str] = None) -> Optional[Order]:
+        """Flags the matched order as paid and drops it from the index (caller commits)."""
+        order = db.query(Order).filter(Order.id == match.order_id, Order.status == "pending").first()
+        self.index.remove_order(vendor_id, match.order_id)
+        if not order:
+            return None
+        order.status = "paid"
+        order.match_confidence = match.confidence
+        order.payment_ref = payment_ref
+        return order
+
+    # --- BULK STATEMENT MATCHING ---
+
+    def reconcile_statement(self, db: Session, vendor_id: int, statement: pd.DataFrame) -> dict:
+        """
+        Matches every credit line in a bank statement against the vendor's
+        pending orders. Candidate pairs come from a vectorized range join on
+        the tolerance bounds and are scored in one pandas pass; the final
+        one-to-one assignment is a greedy Python loop over those pairs (it is
+        inherently sequential), then confident matches are written in one UPDATE.
+        """
+        self.index.ensure_loaded(db, vendor_id)
+        credits = normalize_statement(statement).reset_index(drop=True)
+        orders = self.index.pending_frame(vendor_id)
+        orders["created_at"] = pd.to_datetime(orders["created_at"], utc=True)
+        report = {"credits": len(credits), "matched": [], "suggested": [], "unmatched": len(credits)}
+        if credits.empty or orders.empty:
+            return report
+
+        # Range join: every pending order within tolerance of each credit, not just the nearest one,
+        # so a credit can still land on a second order of the same price. Bounds are a superset
+        # (tolerance scales with the order amount); the exact check follows below.
+        order_amounts = orders["amount"].to_numpy(dtype=float)
+        credit_amounts = credits["amount"].to_numpy(dtype=float)
+        slack = np.maximum(AMOUNT_TOLERANCE_ABS, AMOUNT_TOLERANCE_PCT * (credit_amounts + AMOUNT_TOLERANCE_ABS) / (1 - AMOUNT_TOLERANCE_PCT))
+        lo = np.searchsorted(order_amounts, credit_amounts - slack, side="left")
+        hi = np.searchsorted(order_amounts, credit_amounts + slack, side="right")
+        counts = hi - lo
+        if not counts.sum():
+            return report
+        credit_idx = np.repeat(np.arange(len(credits)), counts)
+        order_idx = np.repeat(lo, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        merged = pd.concat([
+            credits.iloc[credit_idx],
+            orders.iloc[order_idx].rename(columns={"amount": "order_amount"}).set_axis(credits.index[credit_idx]),
+        ], axis=1)
+
+        merged["tol"] = (merged["order_amount"] * AMOUNT_TOLERANCE_PCT).clip(lower=AMOUNT_TOLERANCE_ABS)
+        merged["diff"] = (merged["amount"] - merged["order_amount"]).abs()
+        merged["age"] = merged["date"] - merged["created_at"]
+        # Statements are usually date-only, so allow a day before the order timestamp
+        merged = merged[
+            (merged["diff"] <= merged["tol"]) & (merged["age"] <= MATCH_WINDOW) & (merged["age"] >= -timedelta(days=1))
+        ].copy()
+        if merged.empty:
+            return report
+
+        # Names repeat across pairs: score each distinct (narration, customer name) combination once
+        narr_codes, narrations = pd.factorize(merged["narration"])
+        name_codes, names = pd.factorize(merged["customer_name"])  # -1 = unknown
+        width = len(names) + 1
+        combos, inverse = np.unique(narr_codes * width + name_codes + 1, return_inverse=True)
+        narr_tokens = [_name_tokens(n) for n in narrations]
+        name_tokens = [_name_tokens(n) for n in names] + [set()]  # index -1 -> unknown
+        pair_tokens = [(narr_tokens[k // width], name_tokens[k % width - 1]) for k in combos]
+        merged["name_score"] = np.array([_token_score(ta, tb) for ta, tb in pair_tokens])[inverse]
+        # Both names known and sharing nothing: the amount alone must not auto-pay someone else's order
+        merged["name_conflict"] = np.array([bool(ta) and bool(tb) and not (ta & tb) for ta, tb in pair_tokens])[inverse]
+        merged["confidence"] = (
+            0.6 * (1 - merged["diff"] / merged["tol"]).clip(lower=0)
+            + 0.25 * (1 - merged["age"].clip(lower=pd.Timedelta(0)) / MATCH_WINDOW).clip(lower=0)
+            + 0.15 * merged["name_score"]
+        ).round(3)
+
+        # Each credit pays at most one order and each order takes at most one credit:
+        # best confidence first, older order on ties
+        merged = merged.sort_values(["confidence", "created_at"], ascending=[False, True])
+        used_credits, used_orders, keep = set(), set(), []
+        for credit_id, order_id in zip(merged.index.tolist(), merged["order_id"].tolist()):
+            take = credit_id not in used_credits and order_id not in used_orders
+            if take:
+                used_credits.add(credit_id)
+                used_orders.add(order_id)
+            keep.append(take)
+        merged = merged[keep]
+        is_confident = (merged["confidence"] >= MIN_CONFIDENCE) & ~merged["name_conflict"]
+        confident = merged[is_confident]
+        weak = merged[~is_confident]
+
+        if not confident.empty:
+            order_ids = [int(i) for i in confident["order_id"]]
+            # The index can lag the DB (receipts, other workers): only settle orders that are still pending
+            still_pending = {
+                order_id for (order_id,) in
+                db.query(Order.id).filter(Order.id.in_(order_ids), Order.status == "pending").all()
+            }
+            if still_pending:
+                orders = Order.__table__
+                # Core executemany: one statement, each row re-checked as pending at write time
+                db.execute(
+                    update(orders)
+                    .where(orders.c.id == bindparam("order_id"), orders.c.status == "pending")
+                    .values(status="paid", match_confidence=bindparam("confidence"), payment_ref=bindparam("ref")),
+                    [
+                        {"order_id": int(r.order_id), "confidence": float(r.confidence), "ref": r.reference}
+                        for r in confident.itertuples() if int(r.order_id) in still_pending
+                    ]
+                )
+                db.commit()
+            for order_id in order_ids:
+                self.index.remove_order(vendor_id, order_id)
+            confident = confident[confident["order_id"].astype(int).isin(still_pending)]
+
+        columns = ["order_id", "customer_number", "order_amount", "amount", "reference", "confidence"]
+        report["matched"] = _records(confident[columns])
+        report["suggested"] = _records(weak[columns])
+        report["unmatched"] = len(credits) - len(confident)
+        return report
+
+
+def _records(frame: pd.DataFrame) -> List[dict]:
+    frame = frame.rename(columns={"amount": "credit_amount"})
+    frame["order_id"] = frame["order_id"].astype(int)
+    return frame.to_dict(orient="records")
+
+
+def _pick_column(frame: pd.DataFrame, aliases) -> Optional[str]:
+    for alias in aliases:
+        if alias in frame.columns:
+            return alias
+    return None
+
+
+def normalize_statement(statement: pd.DataFrame) -> pd.DataFrame:
+    """Reduces a raw statement to credit lines with amount/date/narration/reference columns."""
+    frame = statement.copy()
+    frame.columns = [str(c).strip().lower() for c in frame.columns]
+
+    credit_col = _pick_column(frame, CREDIT_COLUMNS)
+    date_col = _pick_column(frame, DATE_COLUMNS)
+    if credit_col is None or date_col is None:
+        raise ValueError("Statement needs a credit/amount column and a date column")
+    narration_col = _pick_column(frame, NARRATION_COLUMNS)
+    ref_col = _pick_column(frame, ("reference", "ref", "session id", "transaction reference"))
+
+    # Whole-Naira exports parse as int64; order amounts are float64
+    amounts = pd.to_numeric(frame[credit_col].astype(str).str.replace(r"[^\d.\-]", "", regex=True), errors="coerce").astype(float)
+    out = pd.DataFrame({
+        "amount": amounts,
+        "date": pd.to_datetime(frame[date_col], errors="coerce", dayfirst=True, utc=True),
+        "narration": frame[narration_col].astype(str) if narration_col else "",
+        "reference": frame[ref_col].astype(str) if ref_col else None,
+    })
+    out["reference"] = out["reference"].fillna("statement")
+    return out[(out["amount"] > 0) & out["date"].notna()]
+
+
+reconciler = Reconciler()
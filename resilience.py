@@ -0,0 +1,238 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+from metrics import percentile
+
+# Breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Admission decisions
+ACCEPT = "accept"
+DEGRADE = "degrade"
+SHED = "shed"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose breaker is open."""
+
+    def __init__(self, name: str):
+        super().__init__(f"Circuit '{name}' is open")
+        self.name = name
+
+
+class CircuitBreaker:
+    """
+    Per-dependency breaker over a rolling window of recent calls.
+    Errors, timeouts and calls slower than `slow_call_ms` all count as bad;
+    the breaker opens when the bad ratio crosses `failure_ratio`, then lets a
+    single probe through after `reset_timeout` seconds.
+    """
+
+    def __init__(self, name: str, call_timeout: float, slow_call_ms: float, failure_ratio: float = 0.5,
+                 window: int = 20, min_calls: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.call_timeout = call_timeout
+        self.slow_call_ms = slow_call_ms
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.rejected = 0
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+        return self._state
+
+    def allow(self) -> bool:
+        """True if a call may go out now (reserves the probe slot when half-open)."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, latency_ms: float, ok: bool):
+        bad = not ok or latency_ms > self.slow_call_ms
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+                if bad:
+                    self._trip()
+                else:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                return
+
+            self._outcomes.append(bad)
+            if len(self._outcomes) >= self.min_calls and sum(self._outcomes) / len(self._outcomes) >= self.failure_ratio:
+                self._trip()
+
+    def release(self):
+        """Gives back a half-open probe slot taken by `allow()` when the call never completed."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _trip(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.trips += 1
+        print(f"⚠️ Circuit '{self.name}' OPEN for {self.reset_timeout:.0f}s")
+
+    def call(self, fn, *args, **kwargs):
+        """Synchronous guarded call; time-boxing comes from the client's own timeout."""
+        if not self.allow():
+            raise CircuitOpenError(self.name)
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record((time.perf_counter() - start) * 1000, ok=False)
+            raise
+        except BaseException:
+            # Cancelled by our caller, not failed by the dependency: free the probe slot, record nothing
+            self.release()
+            raise
+        self.record((time.perf_counter() - start) * 1000, ok=True)
+        return result
+
+    async def acall(self, fn, *args, **kwargs):
+        """Async guarded call, cancelled after `call_timeout` seconds."""
+        if not self.allow():
+            raise CircuitOpenError(self.name)
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(fn(*args, **kwargs), timeout=self.call_timeout)
+        except Exception:
+            self.record((time.perf_counter() - start) * 1000, ok=False)
+            raise
+        except BaseException:
+            # Cancelled by our caller, not failed by the dependency: free the probe slot, record nothing
+            self.release()
+            raise
+        self.record((time.perf_counter() - start) * 1000, ok=True)
+        return result
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "recent_calls": len(self._outcomes),
+                "recent_bad": sum(self._outcomes),
+                "trips": self.trips,
+                "rejected": self.rejected,
+                "call_timeout_s": self.call_timeout,
+                "slow_call_ms": self.slow_call_ms,
+            }
+
+
+class AdmissionController:
+    """
+    Decides whether to take on new inbound work: shed it when too much is
+    already in flight, degrade (answer without the LLM) when in-flight depth
+    or the recent p99 crosses its threshold.
+    """
+
+    def __init__(self, max_inflight: int, degrade_inflight: int, degrade_p99_ms: float, samples: int = 500):
+        self.max_inflight = max_inflight
+        self.degrade_inflight = degrade_inflight
+        self.degrade_p99_ms = degrade_p99_ms
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._latency = deque(maxlen=samples)
+        self._p99 = 0.0
+        self._p99_at = 0.0
+        self.decisions = {ACCEPT: 0, DEGRADE: 0, SHED: 0}
+
+    def enter(self) -> str:
+        """Registers one unit of work; every non-shed call must be paired with `exit()`."""
+        with self._lock:
+            if self._inflight >= self.max_inflight:
+                decision = SHED
+            elif self._inflight >= self.degrade_inflight or self._recent_p99() > self.degrade_p99_ms:
+                decision = DEGRADE
+            else:
+                decision = ACCEPT
+            if decision != SHED:
+                self._inflight += 1
+            self.decisions[decision] += 1
+            return decision
+
+    def exit(self, latency_ms: float):
+        with self._lock:
+            self._inflight = max(0, self._inflight - 1)
+            self._latency.append(latency_ms)
+
+    def _recent_p99(self) -> float:
+        # Re-sorting on every request would cost more than the check is worth
+        now = time.monotonic()
+        if now - self._p99_at > 1.0 and self._latency:
+            self._p99 = percentile(sorted(self._latency), 99)
+            self._p99_at = now
+        return self._p99
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "inflight": self._inflight,
+                "p99_ms": round(self._recent_p99(), 2),
+                "max_inflight": self.max_inflight,
+                "degrade_inflight": self.degrade_inflight,
+                "degrade_p99_ms": self.degrade_p99_ms,
+                "decisions": dict(self.decisions),
+            }
+
+
+# --- SHARED INSTANCES ---
+
+breakers: Dict[str, CircuitBreaker] = {
+    "groq": CircuitBreaker(
+        "groq",
+        call_timeout=float(os.getenv("GROQ_TIMEOUT", "10")),
+        slow_call_ms=float(os.getenv("GROQ_SLOW_CALL_MS", "6000")),
+    ),
+    "groq_vision": CircuitBreaker(
+        "groq_vision",
+        call_timeout=float(os.getenv("GROQ_VISION_TIMEOUT", "20")),
+        slow_call_ms=float(os.getenv("GROQ_VISION_SLOW_CALL_MS", "12000")),
+    ),
+    "graph": CircuitBreaker(
+        "graph",
+        call_timeout=float(os.getenv("GRAPH_TIMEOUT", "10")),
+        slow_call_ms=float(os.getenv("GRAPH_SLOW_CALL_MS", "3000")),
+    ),
+}
+
+admission = AdmissionController(
+    max_inflight=int(os.getenv("ADMISSION_MAX_INFLIGHT", "200")),
+    degrade_inflight=int(os.getenv("ADMISSION_DEGRADE_INFLIGHT", "100")),
+    degrade_p99_ms=float(os.getenv("ADMISSION_DEGRADE_P99_MS", "15000")),
+)
+
+
+def resilience_snapshot() -> dict:
+    return {
+        "breakers": {name: b.snapshot() for name, b in breakers.items()},
+        "admission": admission.snapshot(),
+    }
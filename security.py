@@ -1,8 +1,11 @@
+import base64
+import hashlib
 import os
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from cryptography.fernet import Fernet, InvalidToken
 
 # Configuration
 # IMPORTANT: In Render, add a 'SECRET_KEY' environment variable for production security.
@@ -51,3 +54,25 @@ def decode_access_token(token: str) -> Optional[dict]:
     except JWTError:
         # Includes expired, invalid signature, or malformed tokens
         return None
+
+# --- STORED SECRETS (third-party access tokens) ---
+
+# Tokens we must send back out (e.g. Meta access tokens) can't be hashed, so they are encrypted at rest.
+# Defaults to a key derived from SECRET_KEY; set TOKEN_ENCRYPTION_KEY (a Fernet key) to rotate independently.
+_fernet = Fernet(
+    os.getenv("TOKEN_ENCRYPTION_KEY")
+    or base64.urlsafe_b64encode(hashlib.sha256(f"inawo-token:{SECRET_KEY}".encode()).digest())
+)
+
+def encrypt_secret(value: Optional[str]) -> Optional[str]:
+    """Encrypts a third-party token for storage."""
+    return _fernet.encrypt(value.encode()).decode() if value else value
+
+def decrypt_secret(value: Optional[str]) -> Optional[str]:
+    """Decrypts a stored token; values saved before encryption was added are returned as-is."""
+    if not value:
+        return value
+    try:
+        return _fernet.decrypt(value.encode()).decode()
+    except InvalidToken:
+        return value
@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
+from sqlalchemy.orm import Session
+
+from models import Vendor
+from security import decrypt_secret
+
+# Safety net for changes made by other workers; local writes call invalidate()
+REFRESH_INTERVAL = float(os.getenv("TENANT_REFRESH_INTERVAL", "300"))
+# An unknown phone_number_id triggers at most one reload per this many seconds
+MISS_RELOAD_INTERVAL = float(os.getenv("TENANT_MISS_RELOAD_INTERVAL", "30"))
+
+
+class WhatsAppTenant(NamedTuple):
+    vendor_id: int
+    phone_number_id: str
+    token: Optional[str]
+
+
+class WhatsAppTenantMap:
+    """
+    In-memory `phone_number_id -> vendor` map for inbound webhook routing.
+    One query loads every vendor's WhatsApp identity; lookups are a dict get.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tenants: Dict[str, WhatsAppTenant] = {}
+        self._loaded_at = 0.0
+        self._dirty = True
+
+    def invalidate(self):
+        """Call after any change to a vendor's WhatsApp credentials."""
+        with self._lock:
+            self._dirty = True
+
+    def refresh(self, db: Session):
+        rows = db.query(Vendor.id, Vendor.whatsapp_phone_number_id, Vendor.whatsapp_token).filter(
+            Vendor.whatsapp_phone_number_id.isnot(None)
+        ).all()
+        tenants = {
+            r.whatsapp_phone_number_id: WhatsAppTenant(r.id, r.whatsapp_phone_number_id, decrypt_secret(r.whatsapp_token))
+            for r in rows
+        }
+        with self._lock:
+            self._tenants = tenants
+            self._loaded_at = time.monotonic()
+            self._dirty = False
+
+    def resolve(self, db: Session, phone_number_id: Optional[str]) -> Optional[WhatsAppTenant]:
+        """Vendor identity for the business number a webhook was delivered to."""
+        if not phone_number_id:
+            return None
+        with self._lock:
+            age = time.monotonic() - self._loaded_at
+            stale = self._dirty or age > REFRESH_INTERVAL
+            tenant = self._tenants.get(phone_number_id)
+        if stale or (tenant is None and age > MISS_RELOAD_INTERVAL):
+            # Possibly a vendor onboarded by another worker since the last load
+            self.refresh(db)
+            with self._lock:
+                tenant = self._tenants.get(phone_number_id)
+        return tenant
+
+    def __len__(self):
+        with self._lock:
+            return len(self._tenants)
+
+
+whatsapp_tenants = WhatsAppTenantMap()
@@ -0,0 +1,15 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# main.py reads these at import time; keep the app off real services and the dev database
+_workdir = tempfile.mkdtemp(prefix="inawo-test-")
+atexit.register(shutil.rmtree, _workdir, True)
+os.environ.setdefault("GROQ_API_KEY", "test")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_workdir}/test.db")
+
+import database  # noqa: E402  (needs DATABASE_URL set above)
+import models  # noqa: E402
+
+models.Base.metadata.create_all(bind=database.engine)
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models
+from reconciliation import Reconciler
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add(models.Vendor(id=1, business_name="Ada Fabrics", email="ada@example.com", password_hash="x"))
+    session.commit()
+    yield session
+    session.close()
+
+
+def add_order(db, customer_number, amount, hours_ago=1):
+    order = models.Order(
+        vendor_id=1,
+        customer_number=customer_number,
+        items="Lace 6 yard",
+        amount=amount,
+        status="pending",
+        created_at=datetime.now(timezone.utc) - timedelta(hours=hours_ago),
+    )
+    db.add(order)
+    db.commit()
+    return order.id
+
+
+def test_statement_with_whole_naira_credits(db):
+    first = add_order(db, "2348000000001", 20000.0)
+    second = add_order(db, "2348000000002", 15500.0)
+    today = datetime.now(timezone.utc).strftime("%d/%m/%Y")
+    statement = pd.DataFrame({
+        "Date": [today, today, today],
+        "Narration": ["TRF FROM ADA", "TRF FROM BOLA", "POS REVERSAL"],
+        "Credit": ["20,000", 15500, 700],
+    })
+
+    report = Reconciler().reconcile_statement(db, 1, statement)
+
+    assert {m["order_id"] for m in report["matched"]} == {first, second}
+    assert report["unmatched"] == 1
+
+
+def test_near_miss_credit_reaches_second_order_of_same_price(db):
+    older = add_order(db, "2348000000001", 20000.0, hours_ago=3)
+    newer = add_order(db, "2348000000002", 20000.0, hours_ago=2)
+    today = datetime.now(timezone.utc).strftime("%d/%m/%Y")
+    statement = pd.DataFrame({
+        "Date": [today, today],
+        "Narration": ["TRF FROM ADA", "TRF FROM BOLA"],
+        "Credit": [20000, 19990],
+    })
+
+    report = Reconciler().reconcile_statement(db, 1, statement)
+
+    assert {m["order_id"] for m in report["matched"]} == {older, newer}
+    assert report["unmatched"] == 0
+
+
+def test_contradicting_narration_is_only_suggested(db):
+    db.add(models.ChatSession(vendor_id=1, customer_number="2348000000001", customer_name="Adaeze Okafor"))
+    order_id = add_order(db, "2348000000001", 20000.0, hours_ago=70)
+    today = datetime.now(timezone.utc).strftime("%d/%m/%Y")
+    statement = pd.DataFrame({"Date": [today], "Narration": ["TRF FROM JOHN BELLO"], "Credit": [20000]})
+
+    report = Reconciler().reconcile_statement(db, 1, statement)
+
+    assert report["matched"] == []
+    assert [m["order_id"] for m in report["suggested"]] == [order_id]
+    assert db.get(models.Order, order_id).status == "pending"
+
+
+def test_stale_index_does_not_resettle_a_paid_order(db):
+    order_id = add_order(db, "2348000000001", 20000.0)
+    reconciler = Reconciler()
+    reconciler.index.ensure_loaded(db, 1)
+    # Settled elsewhere after the index was loaded
+    db.get(models.Order, order_id).status = "paid"
+    db.get(models.Order, order_id).payment_ref = "RECEIPT-1"
+    db.commit()
+    today = datetime.now(timezone.utc).strftime("%d/%m/%Y")
+    statement = pd.DataFrame({"Date": [today], "Narration": ["TRF FROM ADA"], "Credit": [20000], "Reference": ["STMT-1"]})
+
+    report = reconciler.reconcile_statement(db, 1, statement)
+
+    assert report["matched"] == []
+    db.expire_all()
+    assert db.get(models.Order, order_id).payment_ref == "RECEIPT-1"
@@ -0,0 +1,42 @@
+import asyncio
+import time
+
+import pytest
+
+from resilience import HALF_OPEN, CircuitBreaker
+
+
+def half_open_breaker():
+    breaker = CircuitBreaker("test", call_timeout=5, slow_call_ms=1000, min_calls=1, reset_timeout=0.01)
+    breaker.record(1, ok=False)
+    time.sleep(0.02)
+    assert breaker.state == HALF_OPEN
+    return breaker
+
+
+def test_cancelled_probe_frees_the_slot():
+    breaker = half_open_breaker()
+
+    async def cancel_probe():
+        probe = asyncio.create_task(breaker.acall(asyncio.sleep, 10))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+    asyncio.run(cancel_probe())
+
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_interrupted_sync_probe_frees_the_slot():
+    breaker = half_open_breaker()
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        breaker.call(interrupted)
+
+    assert breaker.allow()
@@ -0,0 +1,77 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from database import SessionLocal
+import inawo_bot
+from inawo_bot import _active_session
+from resilience import CLOSED, breakers
+import models
+
+CHAT_ID = "700000001"
+
+
+def test_active_vendor_ignores_unrelated_session_writes():
+    db = SessionLocal()
+    try:
+        first = models.Vendor(business_name="Ada Fabrics", email="first@example.com", password_hash="x")
+        second = models.Vendor(business_name="Bola Shoes", email="second@example.com", password_hash="x")
+        db.add_all([first, second])
+        db.commit()
+        now = datetime.now(timezone.utc)
+        old = models.ChatSession(customer_number=CHAT_ID, vendor_id=first.id, last_opened_at=now - timedelta(days=1))
+        new = models.ChatSession(customer_number=CHAT_ID, vendor_id=second.id, last_opened_at=now)
+        db.add_all([old, new])
+        db.commit()
+
+        # The first vendor takes over their (older) chat: that must not make them the active vendor again
+        old.is_ai_paused = True
+        db.commit()
+
+        assert _active_session(db, CHAT_ID).vendor_id == second.id
+    finally:
+        db.query(models.ChatSession).filter(models.ChatSession.customer_number == CHAT_ID).delete()
+        db.query(models.Vendor).filter(models.Vendor.email.in_(["first@example.com", "second@example.com"])).delete()
+        db.commit()
+        db.close()
+
+
+class FakePhotoMessage:
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+        self.from_user = SimpleNamespace(full_name="Chinedu Eze")
+        self.photo = [SimpleNamespace(file_id="photo-1", get_file=self._get_file)]
+        self.replies = []
+
+    async def _get_file(self):
+        async def download_as_bytearray():
+            return bytearray(b"receipt")
+        return SimpleNamespace(download_as_bytearray=download_as_bytearray)
+
+    async def reply_text(self, text):
+        self.replies.append(text)
+
+
+def test_open_vision_breaker_keeps_the_telegram_receipt():
+    chat_id = "700000002"
+    db = SessionLocal()
+    vendor = models.Vendor(business_name="Chi Foods", email="photo@example.com", password_hash="x")
+    db.add(vendor)
+    db.commit()
+    db.add(models.ChatSession(customer_number=chat_id, vendor_id=vendor.id, last_opened_at=datetime.now(timezone.utc)))
+    db.commit()
+    message = FakePhotoMessage(chat_id)
+    breakers["groq_vision"]._trip()
+    try:
+        asyncio.run(inawo_bot.handle_photo(SimpleNamespace(message=message), None))
+        sale = db.query(models.Sale).filter(models.Sale.vendor_id == vendor.id).one()
+        assert sale.status == "Pending"
+        assert sale.receipt_url == "telegram-file:photo-1"
+        assert "received your receipt" in message.replies[-1]
+    finally:
+        breakers["groq_vision"]._state = CLOSED
+        db.query(models.Sale).filter(models.Sale.vendor_id == vendor.id).delete()
+        db.query(models.ChatSession).filter(models.ChatSession.customer_number == chat_id).delete()
+        db.delete(vendor)
+        db.commit()
+        db.close()
@@ -0,0 +1,53 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import models
+from database import SessionLocal
+from dependencies import get_current_vendor
+from transcript_buffer import transcript_buffer
+
+CUSTOMER = "2348000000001"
+
+
+@pytest.fixture
+def client():
+    db = SessionLocal()
+    vendor = models.Vendor(business_name="Ada Fabrics", email="transcripts@example.com", password_hash="x")
+    db.add(vendor)
+    db.commit()
+    main.app.dependency_overrides[get_current_vendor] = lambda: vendor
+    yield TestClient(main.app), vendor.id
+    main.app.dependency_overrides.clear()
+    db.query(models.ChatMessage).filter(models.ChatMessage.vendor_id == vendor.id).delete()
+    db.delete(vendor)
+    db.commit()
+    db.close()
+
+
+def read_all(client, limit, flush_after_page=None):
+    seen, params, page = [], {"limit": limit}, 0
+    while True:
+        body = client.get(f"/vendor/transcripts/{CUSTOMER}", params=params).json()
+        seen += [m["content"] for m in body["messages"]]
+        page += 1
+        if page == flush_after_page:
+            transcript_buffer.flush()
+        if body["next_before"] is None:
+            return seen
+        params = {"limit": limit, "before": body["next_before"]}
+        if body["next_before_id"] is not None:
+            params["before_id"] = body["next_before_id"]
+
+
+def test_pages_across_a_flush_without_gaps_or_repeats(client):
+    client, vendor_id = client
+    for i in range(25):
+        transcript_buffer.add(vendor_id, CUSTOMER, "user", f"m{i}")
+        if i == 11:
+            transcript_buffer.flush()
+
+    # Page 1 comes from the buffer; the rest of the buffer is flushed before page 2
+    seen = read_all(client, limit=4, flush_after_page=1)
+
+    assert seen == [f"m{i}" for i in reversed(range(25))]
@@ -0,0 +1,23 @@
+from vendor_context import catalog_digest, parse_catalog
+
+KNOWLEDGE = "\n".join([
+    "Lace 6 yard - ₦20,000",
+    "Ankara: N 7500",
+    "Bag - ,",
+    "Shoes - 40,41,42",
+    "Account - 0123456789",
+    "Delivery within Lagos only",
+])
+
+
+def test_only_real_prices_parse():
+    assert parse_catalog(KNOWLEDGE) == (("Lace 6 yard", 20000.0), ("Ankara", 7500.0))
+
+
+def test_digest_keeps_non_price_lines():
+    digest = catalog_digest(KNOWLEDGE).splitlines()
+
+    assert "- Lace 6 yard: ₦20,000" in digest
+    assert "Shoes - 40,41,42" in digest
+    assert "Delivery within Lagos only" in digest
+    assert len(digest) == 6
@@ -0,0 +1,21 @@
+import random
+
+from fastapi.testclient import TestClient
+
+import main
+from benchmarks import payloads
+from resilience import CLOSED, breakers
+
+
+def test_open_graph_breaker_defers_the_delivery():
+    graph = breakers["graph"]
+    graph._trip()
+    try:
+        payload = payloads.whatsapp_text(random.Random(0), payloads.customer_number(1))
+        response = TestClient(main.app).post("/webhook", json=payload)
+    finally:
+        graph._state = CLOSED
+
+    # Meta redelivers on any non-200, so the reply is retried rather than lost
+    assert response.status_code == 503
+    assert response.json()["status"] == "deferred"
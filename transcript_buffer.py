@@ -0,0 +1,141 @@
+import asyncio
+import atexit
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional, Tuple, TypeVar
+
+from database import SessionLocal
+from models import ChatMessage
+
+# Flush when this many turns are waiting, or every FLUSH_INTERVAL seconds
+MAX_BATCH = int(os.getenv("TRANSCRIPT_MAX_BATCH", "200"))
+FLUSH_INTERVAL = float(os.getenv("TRANSCRIPT_FLUSH_INTERVAL", "2.0"))
+# Hard cap while the DB is unreachable; oldest turns are dropped past this
+MAX_PENDING = int(os.getenv("TRANSCRIPT_MAX_PENDING", "20000"))
+
+T = TypeVar("T")
+
+
+class TranscriptBuffer:
+    """
+    Write-behind buffer for `ChatMessage` rows.
+    Hot paths call `add()` (no DB work); a background task bulk-inserts on a
+    size or time threshold, and `stop()` drains everything at shutdown.
+    """
+
+    def __init__(self, session_factory=SessionLocal, max_batch: int = MAX_BATCH,
+                 flush_interval: float = FLUSH_INTERVAL, max_pending: int = MAX_PENDING):
+        self._session_factory = session_factory
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: List[dict] = []
+        self._last_ts: Optional[datetime] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.flushed = 0
+        self.dropped = 0
+
+    def add(self, vendor_id: int, sender: str, role: str, content: str):
+        """Queues one turn. Safe to call from any thread."""
+        with self._lock:
+            # Strictly increasing timestamps keep buffered turns in order for transcript cursors
+            now = datetime.now(timezone.utc)
+            if self._last_ts is not None and now <= self._last_ts:
+                now = self._last_ts + timedelta(microseconds=1)
+            self._last_ts = now
+            self._pending.append({
+                "vendor_id": vendor_id,
+                "sender": sender,
+                "role": role,
+                "content": content,
+                "created_at": now,
+            })
+            overflow = len(self._pending) - self.max_pending
+            if overflow > 0:
+                del self._pending[:overflow]
+                self.dropped += overflow
+            full = len(self._pending) >= self.max_batch
+
+        if full:
+            if self._loop and self._wake:
+                self._loop.call_soon_threadsafe(self._wake.set)
+            else:
+                # No background task (scripts, shell): flush inline
+                self.flush()
+
+    def pending_for(self, vendor_id: int, sender: str) -> List[dict]:
+        """Turns not yet written to the DB for one conversation, oldest first."""
+        with self._lock:
+            return [r for r in self._pending if r["vendor_id"] == vendor_id and r["sender"] == sender]
+
+    def read_through(self, vendor_id: int, sender: str, load: Callable[[], T]) -> Tuple[List[dict], T]:
+        """
+        Pending turns for one conversation plus `load()` (the DB read), taken
+        while no flush is running so every turn is in exactly one of the two.
+        """
+        with self._flush_lock:
+            return self.pending_for(vendor_id, sender), load()
+
+    def flush(self) -> int:
+        """Bulk-inserts everything queued. Returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+
+            db = self._session_factory()
+            try:
+                db.bulk_insert_mappings(ChatMessage, batch)
+                db.commit()
+                self.flushed += len(batch)
+                return len(batch)
+            except Exception as e:
+                db.rollback()
+                print(f"⚠️ Transcript Flush Error ({len(batch)} turns re-queued): {e}")
+                with self._lock:
+                    self._pending = batch + self._pending
+                return 0
+            finally:
+                db.close()
+
+    # --- LIFECYCLE ---
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self._loop.run_in_executor(None, self.flush)
+
+    def start(self):
+        """Starts the background flusher on the running event loop."""
+        if self._task:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        """Stops the flusher and writes whatever is still queued."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task, self._loop, self._wake = None, None, None
+        await asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+
+transcript_buffer = TranscriptBuffer()
+
+# Last line of defence if the process exits without the shutdown event firing
+atexit.register(transcript_buffer.flush)
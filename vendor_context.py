@@ -0,0 +1,238 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple
+
+from sqlalchemy import event, inspect
+
+from metrics import percentile
+from models import Vendor
+
+MAX_CACHED_VENDORS = int(os.getenv("VENDOR_CONTEXT_CACHE_SIZE", "1024"))
+# Upper bound on catalog text sent with every prompt
+MAX_RAW_KNOWLEDGE_CHARS = 4000
+
+# Vendor columns that feed the compiled context; changing any of them bumps context_version
+CONTEXT_FIELDS = ("business_name", "category", "knowledge_base_text", "out_of_stock_items", "model_tier")
+
+# Identical for every vendor, so it leads the prompt and stays in the provider's prefix cache
+STATIC_RULES = (
+    "You are the AI Sales Assistant for a Nigerian business. "
+    "Rules: "
+    "1. Max 2 sentences per reply. "
+    "2. Use friendly Nigerian business English (e.g., 'Welcome', 'Bless you'). "
+    "3. If an item is out of stock, suggest an alternative politely. "
+    "4. If the user sends an image/receipt, say 'I see your receipt! Verifying now...' "
+    "5. Only quote prices that appear in the catalog below."
+)
+
+
+class CompiledContext(NamedTuple):
+    vendor_id: int
+    version: int
+    business_name: str
+    knowledge: Optional[str]
+    out_of_stock: str
+    model_tier: str
+    catalog_digest: str
+    system_prompt: str
+    prefix_hash: str
+    prompt_tokens_estimate: int
+
+
+# --- PROMPT BUILDING ---
+
+# "Item - ₦20,000" style lines. Prices are plain digits or properly grouped thousands with no
+# leading zero, and at most 7 digits ungrouped, so "40,41,42" sizes and phone/account numbers aren't prices
+CATALOG_LINE = re.compile(
+    r"^\s*(.+?)\s*[-:=–]+\s*(?:₦|N|NGN)?\s*([1-9]\d{0,2}(?:,\d{3})+(?:\.\d+)?|[1-9]\d{0,6}(?:\.\d+)?)\s*$"
+)
+
+
+def _parse_line(line: str) -> Optional[Tuple[str, float]]:
+    m = CATALOG_LINE.match(line)
+    if not m:
+        return None
+    try:
+        return m.group(1).strip(), float(m.group(2).replace(",", ""))
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=512)
+def parse_catalog(knowledge: Optional[str]) -> Tuple[Tuple[str, float], ...]:
+    """'Lace 6 yard - 20000' lines -> (name, price) pairs; cached per knowledge text."""
+    return tuple(item for item in map(_parse_line, (knowledge or "").splitlines()) if item)
+
+
+def catalog_digest(knowledge: Optional[str]) -> str:
+    """Compact catalog text for the prompt: price lines normalized, everything else kept as written."""
+    lines = []
+    for line in (knowledge or "").splitlines():
+        item = _parse_line(line)
+        if item:
+            lines.append(f"- {item[0]}: ₦{item[1]:,.0f}")
+        elif line.strip():
+            lines.append(line.strip())
+    digest = "\n".join(lines)[:MAX_RAW_KNOWLEDGE_CHARS]
+    return digest or "(No catalog provided)"
+
+
+def build_system_prompt(business_name: str, digest: str, out_of_stock: str) -> str:
+    """Static rules, then the vendor's catalog, then stock state: most stable first."""
+    return (
+        f"{STATIC_RULES}\n\n"
+        f"Business: {business_name}\n"
+        f"Catalog:\n{digest}\n\n"
+        f"IMPORTANT: The following items are currently OUT OF STOCK: {out_of_stock}."
+    )
+
+
+def compile_context(vendor: Vendor) -> CompiledContext:
+    business_name = vendor.business_name or "A Nigerian Vendor"
+    out_of_stock = vendor.out_of_stock_items or "None"
+    digest = catalog_digest(vendor.knowledge_base_text)
+    system_prompt = build_system_prompt(business_name, digest, out_of_stock)
+    return CompiledContext(
+        vendor_id=vendor.id,
+        version=vendor.context_version or 0,
+        business_name=business_name,
+        knowledge=vendor.knowledge_base_text,
+        out_of_stock=out_of_stock,
+        model_tier=vendor.model_tier or "auto",
+        catalog_digest=digest,
+        system_prompt=system_prompt,
+        prefix_hash=hashlib.sha256(system_prompt.encode()).hexdigest()[:12],
+        # ~4 characters per token is close enough for trend lines
+        prompt_tokens_estimate=len(system_prompt) // 4,
+    )
+
+
+# --- VERSIONING ---
+
+@event.listens_for(Vendor, "before_update")
+def _bump_context_version(mapper, connection, target):
+    """Any ORM write to a context field invalidates every worker's cached copy."""
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in CONTEXT_FIELDS):
+        target.context_version = (target.context_version or 0) + 1
+
+
+# --- CACHE & METRICS ---
+
+class ContextStats:
+    """Prompt-build time and billed/cached tokens per turn."""
+
+    def __init__(self, max_samples: int = 1000):
+        self._lock = threading.Lock()
+        self._build_ms = deque(maxlen=max_samples)
+        self._compile_ms = deque(maxlen=max_samples)
+        self.turns = 0
+        self.input_tokens = 0
+        self.cached_input_tokens = 0
+        self.output_tokens = 0
+
+    def record_compile(self, ms: float):
+        with self._lock:
+            self._compile_ms.append(ms)
+
+    def record_turn(self, build_ms: float, usage: Optional[dict]):
+        usage = usage or {}
+        with self._lock:
+            self._build_ms.append(build_ms)
+            self.turns += 1
+            self.input_tokens += usage.get("input_tokens", 0)
+            self.output_tokens += usage.get("output_tokens", 0)
+            self.cached_input_tokens += (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+
+    def reset(self):
+        with self._lock:
+            self._build_ms.clear()
+            self._compile_ms.clear()
+            self.turns = self.input_tokens = self.cached_input_tokens = self.output_tokens = 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            build, compiled = sorted(self._build_ms), sorted(self._compile_ms)
+            return {
+                "turns": self.turns,
+                "prompt_build_p50_ms": percentile(build, 50, digits=4),
+                "prompt_build_p95_ms": percentile(build, 95, digits=4),
+                "context_compile_p50_ms": percentile(compiled, 50, digits=4),
+                "input_tokens": self.input_tokens,
+                "cached_input_tokens": self.cached_input_tokens,
+                "cached_share": round(self.cached_input_tokens / self.input_tokens, 3) if self.input_tokens else 0.0,
+                "output_tokens": self.output_tokens,
+            }
+
+
+class VendorContextCache:
+    """
+    Bounded LRU of compiled contexts keyed by vendor id. An entry is reused
+    only while its version matches the vendor row the caller just loaded.
+    """
+
+    def __init__(self, max_size: int = MAX_CACHED_VENDORS):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[int, CompiledContext]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, vendor: Vendor) -> CompiledContext:
+        version = vendor.context_version or 0
+        with self._lock:
+            ctx = self._cache.get(vendor.id)
+            if ctx is not None and ctx.version == version:
+                self._cache.move_to_end(vendor.id)
+                self.hits += 1
+                return ctx
+
+        start = time.perf_counter()
+        ctx = compile_context(vendor)
+        context_stats.record_compile((time.perf_counter() - start) * 1000)
+
+        with self._lock:
+            self.misses += 1
+            self._cache[vendor.id] = ctx
+            self._cache.move_to_end(vendor.id)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+        return ctx
+
+    def invalidate(self, vendor_id: int):
+        with self._lock:
+            self._cache.pop(vendor_id, None)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "cached_vendors": len(self._cache),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+context_stats = ContextStats()
+vendor_contexts = VendorContextCache()
+
+
+def chat_config(vendor: Vendor, thread_id: str, **extra) -> dict:
+    """The LangGraph config for one turn, built around the vendor's cached context."""
+    ctx = vendor_contexts.get(vendor)
+    return {
+        "configurable": {
+            "thread_id": thread_id,
+            "vendor_context": ctx,
+            "model_tier": ctx.model_tier,
+            **extra,
+        }
+    }
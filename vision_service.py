@@ -4,11 +4,16 @@ from langchain_core.messages import HumanMessage
 import os
 import json
 import re
+from resilience import breakers, CircuitOpenError
+
+vision_breaker = breakers["groq_vision"]
 
 # Initialize Groq Vision (using the fast 11B vision model)
 llm_vision = ChatGroq(
     model="llama-3.2-11b-vision-preview",
     temperature=0,
+    request_timeout=vision_breaker.call_timeout,
+    max_retries=0,
     groq_api_key=os.getenv("GROQ_API_KEY")
 )
 
@@ -49,7 +54,7 @@ async def extract_receipt_details(image_bytes):
     )
 
     try:
-        response = await llm_vision.ainvoke([message])
+        response = await vision_breaker.acall(llm_vision.ainvoke, [message])
         content = response.content.strip()
         
         # Clean up any potential markdown garbage (```json ... ```)
@@ -61,6 +66,9 @@ async def extract_receipt_details(image_bytes):
         print(f"✅ Receipt Parsed: ₦{data.get('amount')} from {data.get('bank')}")
         return data
 
+    except CircuitOpenError:
+        # Vision is down: callers acknowledge the receipt and leave it for the vendor
+        return {"error": "Receipt check temporarily unavailable", "degraded": True}
     except Exception as e:
         print(f"❌ Vision Parsing Error: {e}")
         return {"error": "Could not parse receipt", "details": str(e)}
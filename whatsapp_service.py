@@ -1,6 +1,10 @@
 import httpx
 import os
+import time
+import asyncio
+from typing import Dict, Optional
 from dotenv import load_dotenv
+from resilience import breakers, CircuitOpenError
 
 load_dotenv()
 
@@ -8,19 +12,71 @@ load_dotenv()
 WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
 PHONE_NUMBER_ID = os.getenv("PHONE_NUMBER_ID")
 VERSION = "v21.0" 
+# Overridable so staging and the offline benchmark can point at a stand-in
+GRAPH_API_BASE = os.getenv("GRAPH_API_BASE", "https://graph.facebook.com")
+# Meta's default Cloud API throughput is 80 messages/second per business number
+SEND_RATE_PER_SECOND = float(os.getenv("WHATSAPP_SEND_RATE", "80"))
 
-async def send_whatsapp_message(to_number: str, text: str):
-    """Sends a plain text message via the WhatsApp Business API."""
-    if not WHATSAPP_TOKEN or not PHONE_NUMBER_ID:
+class _TokenBucket:
+    """Async token bucket; one per sending phone number."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+_send_buckets: Dict[str, _TokenBucket] = {}
+
+def _bucket_for(phone_number_id: str) -> _TokenBucket:
+    bucket = _send_buckets.get(phone_number_id)
+    if bucket is None:
+        bucket = _send_buckets[phone_number_id] = _TokenBucket(SEND_RATE_PER_SECOND)
+    return bucket
+
+async def send_whatsapp_message(to_number: str, text: str, phone_number_id: Optional[str] = None, token: Optional[str] = None):
+    """
+    Sends a plain text message via the WhatsApp Business API.
+    `phone_number_id`/`token` select the vendor's own business number; the
+    environment credentials are used when they are not given.
+    Returns Meta's response on success, None if the message was not sent, and
+    raises CircuitOpenError while the Graph API breaker is open so the caller
+    can defer the delivery instead of losing the reply.
+    """
+    phone_number_id = phone_number_id or PHONE_NUMBER_ID
+    token = token or WHATSAPP_TOKEN
+    if not token or not phone_number_id:
         print("❌ Error: WHATSAPP_TOKEN or PHONE_NUMBER_ID missing from environment.")
         return None
 
+    breaker = breakers["graph"]
+    if not breaker.allow():
+        raise CircuitOpenError(breaker.name)
+
+    try:
+        await _bucket_for(phone_number_id).acquire()
+    except BaseException:
+        breaker.release()  # Cancelled while queued: don't hold the half-open probe slot
+        raise
+
     # Clean the phone number (ensure no '+', just digits)
     clean_number = "".join(filter(str.isdigit, to_number))
     
-    url = f"https://graph.facebook.com/{VERSION}/{PHONE_NUMBER_ID}/messages"
+    url = f"{GRAPH_API_BASE}/{VERSION}/{phone_number_id}/messages"
     headers = {
-        "Authorization": f"Bearer {WHATSAPP_TOKEN}",
+        "Authorization": f"Bearer {token}",
         "Content-Type": "application/json",
     }
     payload = {
@@ -31,40 +87,70 @@ async def send_whatsapp_message(to_number: str, text: str):
     }
     
     async with httpx.AsyncClient() as client:
+        start = time.perf_counter()
         try:
-            response = await client.post(url, headers=headers, json=payload, timeout=10.0)
+            response = await client.post(url, headers=headers, json=payload, timeout=breaker.call_timeout)
+            # 4xx is our request's fault, not an outage
+            breaker.record((time.perf_counter() - start) * 1000, ok=response.status_code < 500)
             # Log the result for Render debugging
             if response.status_code == 200:
                 print(f"✅ WhatsApp sent to {clean_number}")
-            else:
-                print(f"❌ WhatsApp API Error ({response.status_code}): {response.text}")
-            return response.json()
+                return response.json()
+            print(f"❌ WhatsApp API Error ({response.status_code}): {response.text}")
+            return None
         except Exception as e:
+            breaker.record((time.perf_counter() - start) * 1000, ok=False)
             print(f"⚠️ Connection Error in WhatsApp Service: {e}")
             return None
+        except BaseException:
+            breaker.release()
+            raise
 
-async def get_whatsapp_media_bytes(media_id: str):
-    """Fetches and downloads media (like receipts) from Meta's servers."""
-    if not WHATSAPP_TOKEN:
+async def verify_phone_number(phone_number_id: str, token: str) -> bool:
+    """True only if `token` can read `phone_number_id` on the Graph API, i.e. the caller owns that number."""
+    url = f"{GRAPH_API_BASE}/{VERSION}/{phone_number_id}"
+    headers = {"Authorization": f"Bearer {token}"}
+    try:
+        async with httpx.AsyncClient(timeout=breakers["graph"].call_timeout) as client:
+            response = await client.get(url, headers=headers, params={"fields": "id,display_phone_number"})
+        return response.status_code == 200 and str(response.json().get("id")) == str(phone_number_id)
+    except Exception as e:
+        print(f"⚠️ WhatsApp Number Verification Error: {e}")
+        return False
+
+async def get_whatsapp_media_bytes(media_id: str, token: Optional[str] = None):
+    """Fetches and downloads media (like receipts) from Meta's servers; raises CircuitOpenError like sends do."""
+    token = token or WHATSAPP_TOKEN
+    breaker = breakers["graph"]
+    if not token:
         return None
+    if not breaker.allow():
+        raise CircuitOpenError(breaker.name)
         
-    url = f"https://graph.facebook.com/{VERSION}/{media_id}"
-    headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}"}
+    url = f"{GRAPH_API_BASE}/{VERSION}/{media_id}"
+    headers = {"Authorization": f"Bearer {token}"}
 
-    async with httpx.AsyncClient() as client:
+    async with httpx.AsyncClient(timeout=breaker.call_timeout) as client:
+        start = time.perf_counter()
         try:
             # Step 1: Get the temporary download URL
             response = await client.get(url, headers=headers)
             if response.status_code != 200:
+                breaker.record((time.perf_counter() - start) * 1000, ok=response.status_code < 500)
                 return None
             
             media_url = response.json().get("url")
             
             # Step 2: Download the actual file bytes
             media_response = await client.get(media_url, headers=headers)
+            breaker.record((time.perf_counter() - start) * 1000, ok=media_response.status_code < 500)
             if media_response.status_code == 200:
                 return media_response.content
         except Exception as e:
+            breaker.record((time.perf_counter() - start) * 1000, ok=False)
             print(f"⚠️ Media Download Error: {e}")
+        except BaseException:
+            breaker.release()
+            raise
             
     return None